@@ -2,6 +2,7 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 dotenv_path = "/django-workspace/contact-widget-backend/.env"
@@ -85,6 +86,17 @@ DATABASES = {
 }
 
 
+# Published snapshots, idempotency results and throttle buckets must be seen
+# by every worker process, so the cache is shared. contact_wiget.test_settings
+# swaps in a local one for tests, which run in one process.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CACHE_URL", "redis://localhost:6379/2"),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -142,6 +154,8 @@ AUTH_USER_MODEL = "core.User"
 
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
+CORS_EXPOSE_HEADERS = ["idempotent-replayed", "export-cursor"]
 
 
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
@@ -0,0 +1,6 @@
+# Settings for the test suite, e.g.
+#   python manage.py test --settings=contact_wiget.test_settings
+# or DJANGO_SETTINGS_MODULE=contact_wiget.test_settings for other runners.
+from contact_wiget.settings import *  # noqa: F401,F403
+
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
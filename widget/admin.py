@@ -8,6 +8,7 @@ admin.site.register(UserBrandInfo)
 admin.site.register(WidgetData)
 admin.site.register(WidgetFile)
 admin.site.register(SubmittedData)
+admin.site.register(SubmissionRateLimit)
 admin.site.register(PreFill)
 admin.site.register(SubmitButton)
 admin.site.register(FormTemplate)
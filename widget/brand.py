@@ -0,0 +1,43 @@
+from time import monotonic
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from widget.models import AdminBrandInfo
+
+
+ADMIN_BRAND_INFO_CACHE_KEY = "widget:admin_brand_info"
+# Bumped on every change; each worker's local copy is only trusted while it
+# matches, so a change made through another worker is seen at once.
+ADMIN_BRAND_INFO_GENERATION_KEY = "widget:admin_brand_info:generation"
+ADMIN_BRAND_INFO_LOCAL_TTL = getattr(settings, "ADMIN_BRAND_INFO_LOCAL_TTL", 30)
+
+_MISSING = object()
+_local = {"value": None, "generation": None, "expires": 0.0}
+
+
+def get_admin_brand_info():
+    now = monotonic()
+    generation = cache.get(ADMIN_BRAND_INFO_GENERATION_KEY)
+    if generation is None:
+        cache.add(ADMIN_BRAND_INFO_GENERATION_KEY, uuid4().hex, None)
+        generation = cache.get(ADMIN_BRAND_INFO_GENERATION_KEY)
+    if _local["expires"] > now and _local["generation"] == generation:
+        return _local["value"]
+
+    admin_brand_info = cache.get(ADMIN_BRAND_INFO_CACHE_KEY, _MISSING)
+    if admin_brand_info is _MISSING:
+        admin_brand_info = AdminBrandInfo.objects.first()
+        cache.set(ADMIN_BRAND_INFO_CACHE_KEY, admin_brand_info, None)
+
+    _local["value"] = admin_brand_info
+    _local["generation"] = generation
+    _local["expires"] = now + ADMIN_BRAND_INFO_LOCAL_TTL
+    return admin_brand_info
+
+
+def invalidate_admin_brand_info():
+    _local["expires"] = 0.0
+    cache.delete(ADMIN_BRAND_INFO_CACHE_KEY)
+    cache.set(ADMIN_BRAND_INFO_GENERATION_KEY, uuid4().hex, None)
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend in PROCESS_LOCAL_CACHES:
+        return [
+            Error(
+                "The default cache is local to each process.",
+                hint=(
+                    "Idempotency keys, submission throttling and published "
+                    "snapshots need a cache every worker shares, e.g. RedisCache."
+                ),
+                id="widget.E001",
+            )
+        ]
+    return []
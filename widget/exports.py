@@ -0,0 +1,439 @@
+import csv
+import json
+import re
+import tempfile
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Max, Min
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+
+from widget.models import ExportJob, LegacySubmissionKey, SubmittedData
+from widget.schemas import get_registry
+
+try:
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+except ImportError:  # XLSX exports are only offered when it is installed
+    openpyxl = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # likewise Parquet
+    pyarrow = None
+
+
+EXPORT_CHUNK_SIZE = getattr(settings, "WIDGET_EXPORT_CHUNK_SIZE", 2000)
+RANGE_BLOCK_SIZE = 64 * 2**10
+EXPORT_CURSOR_HEADER = "Export-Cursor"
+# A pending or running job older than this is taken to have lost its worker.
+EXPORT_JOB_TIMEOUT = getattr(settings, "WIDGET_EXPORT_JOB_TIMEOUT", 60 * 60)
+# Delta exports leave rows younger than this for the next export.
+EXPORT_SETTLE_SECONDS = getattr(settings, "WIDGET_EXPORT_SETTLE_SECONDS", 30)
+PARQUET_ROW_GROUP_SIZE = 16 * EXPORT_CHUNK_SIZE
+XLSX_MAX_ROWS = 1_048_576
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class Echo:
+    # A file-like object for csv.writer that hands each line back.
+    def write(self, value):
+        return value
+
+
+def export_columns(widget, registry):
+    # The schema registry knows every column of versioned submissions; the
+    # keys of those stored before schemas existed are kept per widget.
+    columns = registry.columns()
+    legacy = LegacySubmissionKey.objects.filter(widget=widget)
+    return columns + sorted(
+        set(legacy.values_list("key", flat=True)).difference(columns)
+    )
+
+
+def export_rows(widget, registry, columns, queryset, meta=False):
+    # Yields each submission as a list of values in ``columns`` order,
+    # holding at most one chunk of rows in memory. With ``meta`` each list
+    # starts with the submission's id and created_at.
+    projections = {}
+    fields = ["schema_id", "data"]
+    if meta:
+        fields = ["id", "created_at", *fields]
+    rows = queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for row in rows:
+        head = []
+        if meta:
+            head = [row[0], row[1].isoformat()]
+        schema_id, data = row[-2:]
+        if schema_id is None:
+            yield head + [data.get(column) for column in columns]
+            continue
+        projection = projections.get(schema_id)
+        if projection is None:
+            if schema_id not in registry.schemas:
+                # Registered after the export started.
+                registry = get_registry(widget, {schema_id})
+            projection = projections[schema_id] = registry.projection(
+                schema_id, columns
+            )
+        yield head + [
+            data[index] if index is not None and index < len(data) else None
+            for index in projection
+        ]
+
+
+def csv_stream(columns, rows, meta=False):
+    # UTF-8 CSV in chunks of about EXPORT_CHUNK_SIZE rows.
+    writer = csv.writer(Echo())
+    if meta:
+        columns = ["id", "created_at", *columns]
+    yield writer.writerow(columns).encode()
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield "".join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield "".join(chunk).encode()
+
+
+def ndjson_stream(columns, rows, meta=False):
+    # One JSON object per line; empty values are left out of "data".
+    chunk = []
+    for row in rows:
+        entry = {}
+        if meta:
+            entry["id"], entry["created_at"] = row[:2]
+            row = row[2:]
+        entry["data"] = {
+            column: value for column, value in zip(columns, row) if value is not None
+        }
+        chunk.append(json.dumps(entry, ensure_ascii=False) + "\n")
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield "".join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield "".join(chunk).encode()
+
+
+def _xlsx_cell(sheet, value):
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value, ensure_ascii=False)
+    if not isinstance(value, str):
+        return value
+    cell = WriteOnlyCell(sheet, ILLEGAL_CHARACTERS_RE.sub("", value))
+    # Never let a submitted "=..." become a formula.
+    cell.data_type = "s"
+    return cell
+
+
+def xlsx_stream(columns, rows, meta=False):
+    # openpyxl's write-only mode spools rows to disk, so memory stays flat;
+    # the zip container can only be sent once it is complete.
+    if meta:
+        columns = ["id", "created_at", *columns]
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet, count = None, XLSX_MAX_ROWS
+    for row in rows:
+        if count >= XLSX_MAX_ROWS:
+            # Spreadsheets stop at XLSX_MAX_ROWS rows; carry on in a new sheet.
+            sheet = workbook.create_sheet(f"Submissions {len(workbook.worksheets) + 1}")
+            sheet.append(columns)
+            count = 1
+        sheet.append([_xlsx_cell(sheet, value) for value in row])
+        count += 1
+    if sheet is None:
+        workbook.create_sheet("Submissions 1").append(columns)
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        yield from iter(lambda: output.read(RANGE_BLOCK_SIZE), b"")
+
+
+class ParquetSink:
+    # A write-only file for pyarrow whose bytes are handed back per row group.
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def _parquet_value(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _parquet_names(columns, meta):
+    # Parquet column names must be distinct strings, but labels may be
+    # missing, repeated, or the same as the id and created_at columns.
+    seen = {"id", "created_at"} if meta else set()
+    names = []
+    for index, column in enumerate(columns, 1):
+        name = base = str(column) if column not in (None, "") else f"column{index}"
+        suffix = 2
+        while name in seen:
+            name = f"{base}_{suffix}"
+            suffix += 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def parquet_stream(columns, rows, meta=False):
+    # Submitted values have no declared type, so data columns are strings
+    # (non-string JSON values encoded as JSON); id and created_at are typed.
+    fields = [
+        pyarrow.field(name, pyarrow.string())
+        for name in _parquet_names(columns, meta)
+    ]
+    if meta:
+        fields = [
+            pyarrow.field("id", pyarrow.int64()),
+            pyarrow.field("created_at", pyarrow.timestamp("us", tz="UTC")),
+            *fields,
+        ]
+    schema = pyarrow.schema(fields)
+    sink = ParquetSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+
+    def row_group(batch):
+        values = list(zip(*batch))
+        arrays = []
+        for index, field in enumerate(fields):
+            column = values[index]
+            if field.type == pyarrow.string():
+                column = [_parquet_value(value) for value in column]
+            elif meta and index == 1:
+                column = [datetime.fromisoformat(value) for value in column]
+            arrays.append(pyarrow.array(column, type=field.type))
+        writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+        return sink.drain()
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= PARQUET_ROW_GROUP_SIZE:
+            yield row_group(batch)
+            batch = []
+    if batch:
+        yield row_group(batch)
+    writer.close()
+    yield sink.drain()
+
+
+class ExportRenderer(BaseRenderer):
+    # Exports are streamed by the view; only error payloads are rendered.
+    charset = "utf-8"
+    stream = None
+    # Whether rows always start with id and created_at.
+    row_meta = False
+    compressible = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode()
+
+
+class CSVExportRenderer(ExportRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    stream = staticmethod(csv_stream)
+
+
+class NDJSONExportRenderer(ExportRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    stream = staticmethod(ndjson_stream)
+    row_meta = True
+
+
+class XLSXExportRenderer(ExportRenderer):
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    format = "xlsx"
+    stream = staticmethod(xlsx_stream)
+    compressible = False
+
+
+class ParquetExportRenderer(ExportRenderer):
+    media_type = "application/vnd.apache.parquet"
+    format = "parquet"
+    stream = staticmethod(parquet_stream)
+    row_meta = True
+    compressible = False
+
+
+# The first format is the default.
+EXPORT_RENDERERS = [CSVExportRenderer, NDJSONExportRenderer]
+if openpyxl is not None:
+    EXPORT_RENDERERS.append(XLSXExportRenderer)
+if pyarrow is not None:
+    EXPORT_RENDERERS.append(ParquetExportRenderer)
+EXPORT_FORMATS = {renderer.format: renderer for renderer in EXPORT_RENDERERS}
+
+
+def export_content(widget, renderer, queryset, meta=False, tap=None):
+    # The export of ``queryset`` as byte chunks in the renderer's format.
+    # ``tap`` may wrap the row iterator, e.g. to count rows.
+    meta = meta or renderer.row_meta
+    registry = get_registry(widget)
+    columns = export_columns(widget, registry)
+    rows = export_rows(widget, registry, columns, queryset, meta=meta)
+    if tap is not None:
+        rows = tap(rows)
+    return renderer.stream(columns, rows, meta=meta)
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    # An explicit ?format= must match, but an Accept header naming no export
+    # format (e.g. a client that always sends application/json) gets the
+    # default one rather than a 406.
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+def delta_bounds(queryset, since, limit=None):
+    # The id range (since, cursor] of a delta export, decided before any row
+    # is streamed so the cursor can go in a header. Ids are used rather than
+    # created_at because ingest batches can arrive with older timestamps.
+    newer = queryset.filter(id__gt=since)
+    # Ids are handed out before commit, so a row can become visible after
+    # rows with higher ids. The cursor stops short of the first recent row
+    # so such a row is not skipped by the next export.
+    cutoff = timezone.now() - timedelta(seconds=EXPORT_SETTLE_SECONDS)
+    unsettled = newer.filter(created_at__gt=cutoff).aggregate(first=Min("id"))
+    if unsettled["first"] is not None:
+        newer = newer.filter(id__lt=unsettled["first"])
+    if limit:
+        cursor = (
+            newer.order_by("id").values_list("id", flat=True)[limit - 1 : limit].first()
+        )
+        if cursor is not None:
+            return cursor
+    return newer.aggregate(cursor=Max("id"))["cursor"] or since
+
+
+def fingerprint(widget):
+    # Changes whenever a submission is added or removed or the form (and so
+    # the header) is edited. One index seek on (widget, created_at, id).
+    latest = (
+        SubmittedData.objects.filter(widget=widget)
+        .order_by("-created_at", "-id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    return f"{widget.version}:{widget.total_submissions}:{latest or 0}"
+
+
+def expire_stale_jobs(widget):
+    # Fails jobs whose task was lost or whose worker died, so they stop being
+    # handed out and a fresh job is enqueued instead. A worker that does
+    # claim one later finds it no longer pending.
+    now = timezone.now()
+    return ExportJob.objects.filter(
+        widget=widget,
+        status__in=[ExportJob.PENDING, ExportJob.RUNNING],
+        created_at__lt=now - timedelta(seconds=EXPORT_JOB_TIMEOUT),
+    ).update(status=ExportJob.FAILED, error="Export timed out.", finished_at=now)
+
+
+def write_export(job):
+    # Writes the export to a temporary file, reporting progress once per
+    # chunk of rows, then hands it to storage.
+    widget = job.widget
+    queryset = SubmittedData.objects.filter(widget=widget).order_by("created_at", "id")
+    counted = [0]
+
+    def counting(rows):
+        for counted[0], row in enumerate(rows, 1):
+            if counted[0] % EXPORT_CHUNK_SIZE == 0:
+                ExportJob.objects.filter(pk=job.pk).update(rows_written=counted[0])
+            yield row
+
+    content = export_content(
+        widget, EXPORT_FORMATS[job.format], queryset, tap=counting
+    )
+    with tempfile.TemporaryFile() as output:
+        for chunk in content:
+            output.write(chunk)
+        job.size = output.tell()
+        job.rows_written = counted[0]
+        output.seek(0)
+        job.file.save(f"{job.pk}.{job.format}", File(output), save=False)
+
+
+def _read_range(handle, length):
+    try:
+        while length > 0:
+            block = handle.read(min(RANGE_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        handle.close()
+
+
+def ranged_file_response(request, field_file, size, etag, filename, content_type):
+    # Serves a stored file honouring a single "bytes=" Range (and If-Range),
+    # so interrupted downloads can resume. Multiple ranges get the whole file.
+    start, end, status = 0, size - 1, 200
+    header = request.META.get("HTTP_RANGE", "")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    match = RANGE_RE.match(header.strip())
+    if match and any(match.groups()) and if_range in (None, etag):
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start = max(size - int(last), 0)
+        if start > end:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        status = 206
+
+    handle = field_file.open("rb")
+    handle.seek(start)
+    response = StreamingHttpResponse(
+        _read_range(handle, end - start + 1), status=status, content_type=content_type
+    )
+    response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    if status == 206:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
@@ -0,0 +1,74 @@
+import functools
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# Results and locks are kept in the shared cache (see widget.checks) so a
+# retry that reaches another worker still finds them.
+IDEMPOTENCY_TTL = getattr(settings, "WIDGET_IDEMPOTENCY_TTL", 60 * 60)
+# Upper bound on how long a request may hold its key while running.
+IDEMPOTENCY_LOCK_TIMEOUT = getattr(settings, "WIDGET_IDEMPOTENCY_LOCK_TIMEOUT", 60)
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def get_idempotency_key(request):
+    key = request.headers.get("Idempotency-Key")
+    # Multipart bodies are left alone here so the view can still install its
+    # upload handlers before parsing.
+    if not key and request.content_type.startswith("application/json"):
+        key = request.data.get("submissionId")
+    return str(key) if key else None
+
+
+def idempotent(scope):
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = get_idempotency_key(request)
+            if key is None:
+                return view_method(self, request, *args, **kwargs)
+            if len(key) > 255:
+                return Response(
+                    {"error": "Idempotency-Key must be at most 255 characters."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            target = ":".join(str(value) for value in kwargs.values())
+            digest = hashlib.sha256(key.encode()).hexdigest()
+            result_key = f"widget:idempotency:{scope}:{target}:{digest}"
+            lock_key = f"{result_key}:lock"
+
+            stored = cache.get(result_key)
+            if stored is not None:
+                return Response(
+                    stored["data"],
+                    status=stored["status"],
+                    headers={REPLAYED_HEADER: "true"},
+                )
+            if not cache.add(lock_key, 1, IDEMPOTENCY_LOCK_TIMEOUT):
+                return Response(
+                    {"error": "A request with this Idempotency-Key is in progress."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+            try:
+                response = view_method(self, request, *args, **kwargs)
+                # Only successful submissions are replayed; a rejected one may
+                # be corrected and sent again under the same key.
+                if status.is_success(response.status_code):
+                    cache.set(
+                        result_key,
+                        {"status": response.status_code, "data": response.data},
+                        IDEMPOTENCY_TTL,
+                    )
+            finally:
+                cache.delete(lock_key)
+            return response
+
+        return wrapper
+
+    return decorator
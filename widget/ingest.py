@@ -0,0 +1,224 @@
+import fcntl
+import glob
+import json
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from widget import sheets
+from widget.models import (
+    LegacySubmissionKey,
+    SubmittedData,
+    WidgetData,
+    WidgetRollup,
+    WidgetSchema,
+)
+from widget.schemas import encode, get_schema
+from widget.tasks import process_submission_batch
+
+
+# "sync" inserts each submission in the request, "buffered" appends it to the
+# local spool and leaves the insert to the flusher.
+INGEST_MODE = getattr(settings, "WIDGET_SUBMISSION_INGEST", "sync")
+
+# "fsync" acknowledges a submission once it is on disk, "write" once the OS
+# has it (survives a worker crash, not a host crash).
+INGEST_DURABILITY = getattr(settings, "WIDGET_INGEST_DURABILITY", "fsync")
+
+INGEST_DIR = getattr(
+    settings, "WIDGET_INGEST_DIR", os.path.join(settings.BASE_DIR, "var", "ingest")
+)
+INGEST_BATCH_SIZE = getattr(settings, "WIDGET_INGEST_BATCH_SIZE", 500)
+
+SPOOL_NAME = "submissions.jsonl"
+LOCK_NAME = "submissions.lock"
+# Held for a whole flush so only one flusher reads the rotated files.
+FLUSH_LOCK_NAME = "flush.lock"
+
+
+def is_buffered():
+    return INGEST_MODE == "buffered"
+
+
+def _path(name):
+    return os.path.join(INGEST_DIR, name)
+
+
+def _lock(mode, name=LOCK_NAME):
+    os.makedirs(INGEST_DIR, exist_ok=True)
+    fd = os.open(_path(name), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, mode)
+    except BlockingIOError:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _unlock(fd):
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def enqueue(widget, field_values):
+    record = {
+        "key": str(uuid.uuid4()),
+        "widget_id": str(widget.id),
+        "created_at": timezone.now().isoformat(),
+        "schema_id": get_schema(widget).pk,
+        "field_values": field_values,
+    }
+    line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+    # Appenders share the lock so they only exclude the flusher's rotation;
+    # a single O_APPEND write keeps concurrent records whole.
+    lock = _lock(fcntl.LOCK_SH)
+    try:
+        fd = os.open(_path(SPOOL_NAME), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+            if INGEST_DURABILITY == "fsync":
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+    finally:
+        _unlock(lock)
+    return record["key"]
+
+
+def _rotate():
+    lock = _lock(fcntl.LOCK_EX)
+    try:
+        if os.path.exists(_path(SPOOL_NAME)):
+            os.rename(
+                _path(SPOOL_NAME),
+                _path(f"submissions.{time.time_ns()}.flushing"),
+            )
+    finally:
+        _unlock(lock)
+    # Files left behind by an interrupted flush are picked up again.
+    return sorted(glob.glob(_path("submissions.*.flushing")))
+
+
+def _read_records(path):
+    with open(path, "rb") as spool:
+        for line in spool:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A torn last line from a crash mid-append.
+                continue
+
+
+def _payload(record, schemas):
+    schema = schemas.get(record.get("schema_id"))
+    if schema is None:
+        # Spooled before schemas were recorded.
+        return {
+            "data": {item["label"]: item["value"] for item in record["field_values"]}
+        }
+    return {"schema": schema, "data": encode(schema, record["field_values"])}
+
+
+def _persist(records):
+    widget_ids = {record["widget_id"] for record in records}
+    sheet_owners = {
+        str(pk): is_oauth
+        for pk, is_oauth in WidgetData.objects.filter(pk__in=widget_ids).values_list(
+            "pk", "user__is_oauth"
+        )
+    }
+    already_saved = {
+        str(key)
+        for key in SubmittedData.objects.filter(
+            ingest_key__in=[record["key"] for record in records]
+        ).values_list("ingest_key", flat=True)
+    }
+    records = [
+        record
+        for record in records
+        if record["widget_id"] in sheet_owners
+        and record["key"] not in already_saved
+    ]
+    if not records:
+        return 0
+
+    schemas = WidgetSchema.objects.in_bulk(
+        {record["schema_id"] for record in records if record.get("schema_id")}
+    )
+    moments = {}
+    with transaction.atomic():
+        # bulk_create skips SubmittedData.save(), so its bookkeeping is done here.
+        submissions = SubmittedData.objects.bulk_create(
+            [
+                SubmittedData(
+                    widget_id=record["widget_id"],
+                    ingest_key=record["key"],
+                    created_at=parse_datetime(record.get("created_at") or "")
+                    or timezone.now(),
+                    **_payload(record, schemas),
+                )
+                for record in records
+            ]
+        )
+        for submission in submissions:
+            moments.setdefault(submission.widget_id, []).append(submission.created_at)
+            if submission.schema_id is None:
+                LegacySubmissionKey.add(submission.widget_id, submission.data)
+        for widget_id, created in moments.items():
+            WidgetData.add_submissions(widget_id, len(created))
+            WidgetRollup.add(widget_id, "submissions", created)
+
+        # Sheet rows are buffered with the submissions, so a failure sending
+        # the notifications afterwards cannot lose them.
+        sheet_rows = {}
+        for record in records:
+            if sheet_owners[record["widget_id"]]:
+                sheet_rows.setdefault(record["widget_id"], []).append(
+                    record["field_values"]
+                )
+        for widget_id, rows in sheet_rows.items():
+            sheets.enqueue(
+                "widget.WidgetData",
+                widget_id,
+                [value["label"].lower() for value in rows[0]],
+                [[value["value"] for value in field_values] for field_values in rows],
+            )
+
+        batch = [
+            {"widget_id": record["widget_id"], "field_values": record["field_values"]}
+            for record in records
+        ]
+        transaction.on_commit(
+            lambda: process_submission_batch.delay(batch, sheets_buffered=True)
+        )
+    return len(records)
+
+
+def flush(batch_size=None):
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    try:
+        flush_lock = _lock(fcntl.LOCK_EX | fcntl.LOCK_NB, FLUSH_LOCK_NAME)
+    except BlockingIOError:
+        # Another flusher is at work and will take everything rotated so far.
+        return 0
+    flushed = 0
+    try:
+        for path in _rotate():
+            batch = []
+            for record in _read_records(path):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    flushed += _persist(batch)
+                    batch = []
+            if batch:
+                flushed += _persist(batch)
+            os.remove(path)
+    finally:
+        _unlock(flush_lock)
+    return flushed
@@ -0,0 +1,56 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from widget.models import WidgetData
+from widget.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild hourly and daily submission and file rollups from stored "
+        "rows. Booking counts are left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("widgets", nargs="*", help="Widget ids; all by default.")
+        parser.add_argument(
+            "--since",
+            help="Only rebuild buckets from this date (UTC day) onwards.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Widgets rebuilt per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = parse_datetime(options["since"])
+                day = parse_date(options["since"]) if since is None else None
+            except ValueError:
+                since = day = None
+            if since is None:
+                if day is None:
+                    raise CommandError("--since must be an ISO 8601 date.")
+                since = datetime(day.year, day.month, day.day)
+            if timezone.is_naive(since):
+                since = since.replace(tzinfo=dt_timezone.utc)
+
+        widget_ids = WidgetData.objects.order_by("pk").values_list("pk", flat=True)
+        if options["widgets"]:
+            widget_ids = widget_ids.filter(pk__in=options["widgets"])
+        widget_ids = list(widget_ids)
+
+        for offset in range(0, len(widget_ids), options["batch_size"]):
+            batch = widget_ids[offset : offset + options["batch_size"]]
+            rebuild(batch, since)
+            self.stdout.write(f"Rebuilt {offset + len(batch)}/{len(widget_ids)}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt rollups for {len(widget_ids)} widget(s).")
+        )
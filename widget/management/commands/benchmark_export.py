@@ -0,0 +1,124 @@
+import csv
+import io
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import compress_sequence
+
+from widget.exports import EXPORT_FORMATS, CSVExportRenderer, export_content
+from widget.models import SubmittedData, WidgetData
+from widget.schemas import encode, get_registry, get_schema
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_export(widget):
+    # The export as it was: load every row, collect keys in a second pass
+    # and build the whole file in memory.
+    entries = list(
+        SubmittedData.objects.filter(widget=widget).order_by("created_at", "id")
+    )
+    registry = get_registry(widget, {entry.schema_id for entry in entries})
+    rows = [registry.decode(entry.schema_id, entry.data) for entry in entries]
+    keys = set()
+    for row in rows:
+        keys.update(row.keys())
+    keys = sorted(keys)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(keys)
+    for row in rows:
+        writer.writerow([row.get(key, "") for key in keys])
+    return len(buffer.getvalue().encode())
+
+
+def streamed_export(widget, renderer=CSVExportRenderer, gzipped=False):
+    content = export_content(
+        widget,
+        renderer,
+        SubmittedData.objects.filter(widget=widget).order_by("created_at", "id"),
+    )
+    if gzipped:
+        content = compress_sequence(content)
+    return sum(len(chunk) for chunk in content)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic submissions for a widget inside a rolled-back "
+        "transaction and compare the buffered CSV export with the streaming "
+        "exports in each available format."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("widget", help="Widget id to attach the rows to.")
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument(
+            "--skip-legacy",
+            action="store_true",
+            help="Skip the buffered export, which needs memory for every row.",
+        )
+
+    def handle(self, *args, **options):
+        widget = WidgetData.objects.filter(pk=options["widget"]).first()
+        if widget is None:
+            raise CommandError("Widget not found.")
+        try:
+            with transaction.atomic():
+                self.seed(widget, options["rows"], options["batch_size"])
+                runs = [
+                    (name, lambda renderer=renderer: streamed_export(widget, renderer))
+                    for name, renderer in EXPORT_FORMATS.items()
+                ]
+                runs.append(
+                    ("csv+gzip", lambda: streamed_export(widget, gzipped=True))
+                )
+                if not options["skip_legacy"]:
+                    runs.insert(0, ("buffered", lambda: legacy_export(widget)))
+                for name, run in runs:
+                    self.measure(name, run)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, widget, rows, batch_size):
+        schema = get_schema(widget)
+        rng = random.Random(0)
+        for offset in range(0, rows, batch_size):
+            SubmittedData.objects.bulk_create(
+                [
+                    SubmittedData(
+                        widget=widget,
+                        schema=schema,
+                        created_at=timezone.now(),
+                        data=encode(
+                            schema,
+                            [
+                                {"id": field["id"], "value": f"value {rng.random()}"}
+                                for field in schema.fields
+                            ],
+                        ),
+                    )
+                    for _ in range(min(batch_size, rows - offset))
+                ]
+            )
+        self.stdout.write(f"seeded {rows} rows")
+
+    def measure(self, name, run):
+        tracemalloc.start()
+        start = time.perf_counter()
+        size = run()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{name}: {elapsed:.1f}s, {size / 2**20:.1f} MiB out, "
+            f"peak Python memory {peak / 2**20:.1f} MiB"
+        )
@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from widget import public_views, views
+from widget.models import AppointmentWidget, Container, PricingWidgetV2, WidgetData
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-request overhead of the plain Django public read views "
+        "against the DRF views for warm snapshots."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        iterations = options["iterations"]
+        pricing_v2 = views.PricingWidgetViewSetV2.as_view({"get": "retrieve"})
+        endpoints = [
+            (
+                "form",
+                WidgetData,
+                "uuid",
+                views.WidgetCodeView.as_view(),
+                public_views.widget_config,
+            ),
+            (
+                "pr",
+                Container,
+                "uuid",
+                views.PricingWidgetViewSet.as_view(),
+                public_views.pricing_config,
+            ),
+            (
+                "booking",
+                AppointmentWidget,
+                "uuid",
+                views.AppointmentViewSet.as_view(),
+                public_views.booking_config,
+            ),
+            (
+                "v2/pricing",
+                PricingWidgetV2,
+                "pk",
+                pricing_v2,
+                public_views.pricing_v2_config,
+            ),
+        ]
+
+        for name, model, kwarg, drf_view, fast_path in endpoints:
+            pk = model.objects.values_list("pk", flat=True).first()
+            if pk is None:
+                self.stdout.write(f"{name}: no {model.__name__} to read, skipped")
+                continue
+            fast_view = fast_path(drf_view)
+            kwargs = {kwarg: pk}
+
+            timings = {}
+            for label, view in (("drf", drf_view), ("plain", fast_view)):
+                # Warm the snapshot so only the request handling is measured.
+                view(factory.get("/"), **kwargs)
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    response = view(factory.get("/"), **kwargs)
+                    if hasattr(response, "render"):
+                        response.render()
+                timings[label] = (time.perf_counter() - start) / iterations * 1e6
+
+            self.stdout.write(
+                f"{name}: drf {timings['drf']:.1f}us  "
+                f"plain {timings['plain']:.1f}us  "
+                f"saved {timings['drf'] - timings['plain']:.1f}us/request"
+            )
@@ -0,0 +1,51 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+from widget.recaptcha import VERIFY_URL, RecaptchaVerifier
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare one-off requests.post verification with the pooled verifier, "
+        "usually against recaptcha_stub_server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default=VERIFY_URL)
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=10)
+
+    def handle(self, *args, **options):
+        url = options["url"]
+        verifier = RecaptchaVerifier(url=url, secret="benchmark")
+
+        def unpooled(token):
+            response = requests.post(
+                url, data={"secret": "benchmark", "response": token}
+            )
+            return response.json().get("success", False)
+
+        for label, verify in (("unpooled", unpooled), ("pooled", verifier.verify)):
+            self._run(label, verify, options["requests"], options["concurrency"])
+
+    def _run(self, label, verify, count, concurrency):
+        def timed(_):
+            start = time.perf_counter()
+            verify(uuid.uuid4().hex)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = sorted(pool.map(timed, range(count)))
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{label}: {count / elapsed:.0f} req/s  "
+            f"p50 {statistics.median(latencies) * 1000:.1f}ms  "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms"
+        )
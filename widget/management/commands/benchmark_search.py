@@ -0,0 +1,123 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from widget.models import SubmittedData, WidgetData
+from widget.schemas import encode, get_schema
+from widget.search import search
+
+
+FIRST_NAMES = ["ada", "grace", "alan", "edsger", "barbara", "donald", "frances"]
+LAST_NAMES = ["lovelace", "hopper", "turing", "dijkstra", "liskov", "knuth"]
+WORDS = [f"word{index}" for index in range(5000)]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic submissions for a widget inside a rolled-back "
+        "transaction and compare indexed search with scanning the JSON text."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("widget", help="Widget id to attach the rows to.")
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--queries",
+            nargs="+",
+            default=["ada lovelace", "word4999", "grace word4999", "nomatch"],
+        )
+        parser.add_argument("--skip-scan", action="store_true")
+
+    def handle(self, *args, **options):
+        widget = WidgetData.objects.filter(pk=options["widget"]).first()
+        if widget is None:
+            raise CommandError("Widget not found.")
+        try:
+            with transaction.atomic():
+                self.seed(widget, options["rows"], options["batch_size"])
+                for query in options["queries"]:
+                    self.measure(widget, query, options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, widget, rows, batch_size):
+        schema = get_schema(widget)
+        ids = [field["id"] for field in schema.fields]
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for offset in range(0, rows, batch_size):
+            batch = []
+            for _ in range(min(batch_size, rows - offset)):
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+                words = " ".join(rng.choices(WORDS, k=8))
+                values = [name, f"{name.replace(' ', '.')}@example.com", words]
+                batch.append(
+                    SubmittedData(
+                        widget=widget,
+                        schema=schema,
+                        created_at=timezone.now(),
+                        data=encode(
+                            schema,
+                            [
+                                {"id": field_id, "value": value}
+                                for field_id, value in zip(ids, values)
+                            ],
+                        ),
+                    )
+                )
+            SubmittedData.objects.bulk_create(batch)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"seeded {rows} rows in {elapsed:.1f}s "
+            f"({rows / elapsed:.0f} rows/s including index upkeep)"
+        )
+
+    def measure(self, widget, query, options):
+        queryset = SubmittedData.objects.filter(widget=widget)
+        page_size = options["page_size"]
+
+        def indexed():
+            return list(
+                search(queryset, widget.pk, query)
+                .values("id", "rank")
+                .order_by("-rank", "-id")[:page_size]
+            )
+
+        def scan():
+            filtered = queryset.alias(text=Cast("data", TextField()))
+            for term in query.split():
+                filtered = filtered.filter(text__icontains=term)
+            return list(
+                filtered.values("id").order_by("-created_at", "-id")[:page_size]
+            )
+
+        timings = {"indexed": self._best(indexed, options["repeat"])}
+        matches = search(queryset, widget.pk, query).count()
+        if not options["skip_scan"]:
+            timings["scan"] = self._best(scan, options["repeat"])
+        self.stdout.write(
+            f"{query!r}: {matches} matches, "
+            + "  ".join(f"{name} {ms:.1f}ms" for name, ms in timings.items())
+        )
+
+    def _best(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
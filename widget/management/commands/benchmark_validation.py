@@ -0,0 +1,90 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.utils.datastructures import MultiValueDict
+
+from widget.validation import compile_plan
+
+
+FIELD_TYPES = ["text", "email", "textarea", "consent", "file"]
+
+
+def legacy_process_fields(widget_fields, data, files):
+    # The per-submission loop WidgetCodeView used before validation plans,
+    # minus the WidgetFile insert.
+    field_values = []
+    errors = {}
+    for field in widget_fields:
+        field_id = field["id"]
+        field_type = field["type"]
+        is_required = field["required"]
+        field_label = field.get("label")
+
+        if field_type == "file":
+            uploaded_files = files.getlist(field_id)
+            if is_required and not uploaded_files:
+                errors[field_label] = f"{field_label} is required."
+        else:
+            value = data.get(field_id, "").strip()
+            if field_type == "consent" and is_required and value != "true":
+                errors[field_label] = f"{field_label} is required."
+            elif is_required and not value:
+                errors[field_label] = f"{field_label} is required."
+            elif field_type != "consent":
+                field_values.append(
+                    {"label": field_label, "type": field_type, "value": value}
+                )
+    return field_values, errors
+
+
+def build_form(size):
+    widget_fields = []
+    data = {}
+    for index in range(size):
+        field_type = FIELD_TYPES[index % len(FIELD_TYPES)]
+        field_id = f"f{index}"
+        widget_fields.append(
+            {
+                "id": field_id,
+                "type": field_type,
+                "label": f"Field {index}",
+                "required": field_type != "file",
+            }
+        )
+        if field_type == "email":
+            data[field_id] = f"user{index}@example.com"
+        elif field_type == "consent":
+            data[field_id] = "true"
+        elif field_type != "file":
+            data[field_id] = f"  value {index}  "
+    return widget_fields, data
+
+
+class Command(BaseCommand):
+    help = "Compare compiled validation plans with the legacy field loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000)
+        parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50, 500])
+
+    def handle(self, *args, **options):
+        files = MultiValueDict()
+        for size in options["sizes"]:
+            widget_fields, data = build_form(size)
+            plan = compile_plan(widget_fields)
+            iterations = max(options["iterations"] * 5 // size, 10)
+
+            legacy = self._best(
+                lambda: legacy_process_fields(widget_fields, data, files), iterations
+            )
+            compiled = self._best(lambda: plan.validate(data, files), iterations)
+
+            self.stdout.write(
+                f"{size} fields: legacy {legacy:.1f}us  plan {compiled:.1f}us  "
+                f"({legacy / compiled:.2f}x)"
+            )
+
+    def _best(self, func, iterations, repeat=5):
+        return min(timeit.repeat(func, number=iterations, repeat=repeat)) / (
+            iterations / 1e6
+        )
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from widget import sheets
+
+
+class Command(BaseCommand):
+    help = (
+        "Append Google Sheet rows that have waited longer than "
+        "WIDGET_SHEETS_FLUSH_SECONDS, e.g. after a worker crash, and report "
+        "each sheet's lag."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running and sweep every INTERVAL seconds.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            for entry in sheets.due():
+                lag = (timezone.now() - entry["oldest"]).total_seconds()
+                try:
+                    flushed = sheets.flush(entry["model_name"], entry["widget_id"])
+                except Exception as exc:
+                    self.stderr.write(
+                        f"{entry['widget_id']}: {entry['pending_rows']} row(s) "
+                        f"{lag:.0f}s behind, flush failed: {exc}"
+                    )
+                    continue
+                self.stdout.write(
+                    f"{entry['widget_id']}: appended {flushed} row(s), "
+                    f"{lag:.0f}s behind"
+                )
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from widget import ingest
+
+
+class Command(BaseCommand):
+    help = "Persist buffered form submissions from the local ingest spool."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=ingest.INGEST_BATCH_SIZE,
+            help="Submissions inserted per bulk_create.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running and flush every INTERVAL seconds.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = ingest.flush(options["batch_size"])
+            if flushed or not options["interval"]:
+                self.stdout.write(f"Flushed {flushed} submission(s).")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
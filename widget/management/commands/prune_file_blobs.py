@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from widget.models import FileBlob
+
+
+class Command(BaseCommand):
+    help = "Delete stored upload blobs that no WidgetFile references any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=24,
+            help="Keep unreferenced blobs this long so in-flight uploads can reuse them.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options["grace_hours"])
+        candidates = FileBlob.objects.filter(
+            ref_count=0, last_referenced_at__lt=cutoff
+        ).values_list("pk", "file")
+
+        pruned = 0
+        for pk, name in candidates.iterator():
+            if options["dry_run"]:
+                self.stdout.write(name)
+                pruned += 1
+                continue
+            # Re-checked in the DELETE so a blob that was just reused survives.
+            deleted, _ = FileBlob.objects.filter(pk=pk, ref_count=0).delete()
+            if deleted:
+                FileBlob.file.field.storage.delete(name)
+                pruned += 1
+
+        action = "Would prune" if options["dry_run"] else "Pruned"
+        self.stdout.write(self.style.SUCCESS(f"{action} {pruned} blob(s)."))
@@ -0,0 +1,66 @@
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for the reCAPTCHA siteverify endpoint. Point "
+        "RECAPTCHA_VERIFY_URL at it to benchmark verification."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--latency", type=float, default=50, help="Response delay in ms."
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0,
+            help="Fraction of requests answered with a 503.",
+        )
+
+    def handle(self, *args, **options):
+        latency = options["latency"] / 1000
+        error_rate = options["error_rate"]
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode())
+                time.sleep(latency)
+                if random.random() < error_rate:
+                    self._reply(503, {"success": False})
+                    return
+                token = form.get("response", [""])[0]
+                self._reply(200, {"success": not token.startswith("invalid")})
+
+            def _reply(self, code, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", options["port"]), Handler)
+        self.stdout.write(
+            f"reCAPTCHA stub listening on http://127.0.0.1:{options['port']}/"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
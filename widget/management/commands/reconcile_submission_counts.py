@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from widget.models import SubmittedData, WidgetData
+
+
+class Command(BaseCommand):
+    help = "Recount submissions and repair drifted WidgetData.total_submissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drifted widgets without updating them.",
+        )
+
+    def handle(self, *args, **options):
+        counts = (
+            SubmittedData.objects.filter(widget=OuterRef("pk"))
+            .order_by()
+            .values("widget")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        drifted = (
+            WidgetData.objects.annotate(actual=Coalesce(Subquery(counts), 0))
+            .exclude(total_submissions=F("actual"))
+            .values_list("pk", "total_submissions", "actual")
+        )
+
+        repaired = 0
+        for widget_id, stored, actual in drifted.iterator():
+            self.stdout.write(f"{widget_id}: {stored} -> {actual}")
+            if not options["dry_run"]:
+                WidgetData.add_submissions(widget_id, actual - stored)
+            repaired += 1
+
+        action = "Found" if options["dry_run"] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{action} {repaired} drifted widget(s)."))
@@ -0,0 +1,32 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from widget.throttling import shed_counts
+
+
+class Command(BaseCommand):
+    help = "Show how many public submissions the throttle shed, per hour."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=24)
+        parser.add_argument(
+            "--widget",
+            help="Only count one widget, e.g. widget.WidgetData:<uuid>.",
+        )
+
+    def handle(self, *args, **options):
+        names = ["widget", "ip"]
+        if options["widget"]:
+            label, pk = options["widget"].split(":", 1)
+            prefix = f"{apps.get_model(label)._meta.label_lower}:{pk}"
+            names = [f"{prefix}:widget", f"{prefix}:ip"]
+
+        counts = shed_counts(options["hours"], names)
+        totals = dict.fromkeys(names, 0)
+        for (hour, name), count in sorted(counts.items()):
+            self.stdout.write(f"{hour}  {name}: {count}")
+            totals[name] += count
+        for name, count in totals.items():
+            self.stdout.write(
+                self.style.SUCCESS(f"Shed by {name} limit: {count}")
+            )
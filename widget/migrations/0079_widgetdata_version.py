@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0078_alter_submitbutton_colors_alter_submitbutton_spacing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetdata',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_total_submissions(apps, schema_editor):
+    WidgetData = apps.get_model("widget", "WidgetData")
+    SubmittedData = apps.get_model("widget", "SubmittedData")
+    counts = (
+        SubmittedData.objects.filter(widget=OuterRef("pk"))
+        .order_by()
+        .values("widget")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    WidgetData.objects.update(total_submissions=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0079_widgetdata_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetdata',
+            name='total_submissions',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_total_submissions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:05
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_script_hash(apps, schema_editor):
+    WidgetData = apps.get_model("widget", "WidgetData")
+    widgets = WidgetData.objects.exclude(script__isnull=True).exclude(script="")
+    for widget in widgets.only("script").iterator():
+        WidgetData.objects.filter(pk=widget.pk).update(
+            script_hash=hashlib.sha256(widget.script.encode()).hexdigest()[:16]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0080_widgetdata_total_submissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetdata',
+            name='script_hash',
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+        migrations.RunPython(backfill_script_hash, migrations.RunPython.noop),
+    ]
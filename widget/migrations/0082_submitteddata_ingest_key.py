@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0081_widgetdata_script_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submitteddata',
+            name='ingest_key',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
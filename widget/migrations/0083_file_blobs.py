@@ -0,0 +1,53 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:18
+
+import django.db.models.deletion
+import django.utils.timezone
+import widget.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0082_submitteddata_ingest_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(max_length=255, upload_to=widget.models.blob_path)),
+                ('size', models.PositiveBigIntegerField()),
+                ('content_type', models.CharField(blank=True, max_length=255)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('last_referenced_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='widgetfile',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='widgetfile',
+            name='field_id',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='widgetfile',
+            name='name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='widgetfile',
+            name='file',
+            field=models.FileField(max_length=255, upload_to='widget/files'),
+        ),
+        migrations.AddField(
+            model_name='widgetfile',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='widget.fileblob'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0083_file_blobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionRateLimit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('widget_rate', models.PositiveIntegerField(blank=True, help_text='Submissions per minute for each widget.', null=True)),
+                ('widget_burst', models.PositiveIntegerField(blank=True, null=True)),
+                ('ip_rate', models.PositiveIntegerField(blank=True, help_text='Submissions per minute from one client IP to each widget.', null=True)),
+                ('ip_burst', models.PositiveIntegerField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='submission_rate_limit', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
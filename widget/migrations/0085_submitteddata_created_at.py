@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:22
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0084_submissionratelimit'),
+    ]
+
+    # Nullable first so adding the column does not rewrite the table. The
+    # database default stamps rows inserted by code that predates the field,
+    # so none are left NULL for 0087.
+    operations = [
+        migrations.AddField(
+            model_name='submitteddata',
+            name='created_at',
+            field=models.DateTimeField(
+                db_default=django.db.models.functions.datetime.Now(), null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.utils import timezone
+
+BATCH_SIZE = 5000
+
+
+def backfill_created_at(apps, schema_editor):
+    # The real creation time of existing rows is unknown; they are stamped
+    # with the migration time and keep their relative order through the id.
+    # Each batch commits on its own so no long-lived lock is held.
+    SubmittedData = apps.get_model("widget", "SubmittedData")
+    now = timezone.now()
+    last_pk = 0
+    while True:
+        pks = list(
+            SubmittedData.objects.filter(pk__gt=last_pk, created_at__isnull=True)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:BATCH_SIZE]
+        )
+        if not pks:
+            break
+        SubmittedData.objects.filter(pk__in=pks).update(created_at=now)
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('widget', '0085_submitteddata_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_created_at, migrations.RunPython.noop, atomic=False
+        ),
+    ]
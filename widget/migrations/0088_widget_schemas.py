@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0087_submitteddata_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WidgetSchema',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('fields', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('widget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schemas', to='widget.widgetdata')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='submitteddata',
+            name='schema',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='+', to='widget.widgetschema'),
+        ),
+        migrations.AddConstraint(
+            model_name='widgetschema',
+            constraint=models.UniqueConstraint(fields=('widget', 'version'), name='widgetschema_widget_version'),
+        ),
+    ]
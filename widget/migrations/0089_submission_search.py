@@ -0,0 +1,83 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Submission values joined into one text column; works for positional
+# (list) and legacy label-keyed (dict) payloads alike.
+SQLITE_BODY = "(SELECT group_concat(value, ' ') FROM json_each({row}.data))"
+
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS widget_submission_fts USING fts5("
+    "widget, body, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS widget_submission_fts_insert "
+    "AFTER INSERT ON widget_submitteddata BEGIN "
+    "INSERT INTO widget_submission_fts (rowid, widget, body) "
+    f"VALUES (new.id, new.widget_id, {SQLITE_BODY.format(row='new')}); END",
+    "CREATE TRIGGER IF NOT EXISTS widget_submission_fts_update "
+    "AFTER UPDATE OF data ON widget_submitteddata BEGIN "
+    f"UPDATE widget_submission_fts SET body = {SQLITE_BODY.format(row='new')} "
+    "WHERE rowid = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS widget_submission_fts_delete "
+    "AFTER DELETE ON widget_submitteddata BEGIN "
+    "DELETE FROM widget_submission_fts WHERE rowid = old.id; END",
+    "INSERT INTO widget_submission_fts (rowid, widget, body) "
+    "SELECT id, widget_id, "
+    f"{SQLITE_BODY.format(row='widget_submitteddata')} FROM widget_submitteddata",
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS widget_submission_fts_insert",
+    "DROP TRIGGER IF EXISTS widget_submission_fts_update",
+    "DROP TRIGGER IF EXISTS widget_submission_fts_delete",
+    "DROP TABLE IF EXISTS widget_submission_fts",
+]
+
+# Must stay in step with widget.search.POSTGRES_VECTOR for the planner to
+# use the index.
+POSTGRES_FORWARDS = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS submitteddata_search_gin "
+    "ON widget_submitteddata USING gin "
+    "(jsonb_to_tsvector('simple', data, '[\"string\", \"numeric\"]'))",
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP INDEX CONCURRENTLY IF EXISTS submitteddata_search_gin",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('widget', '0088_widget_schemas'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({"sqlite": SQLITE_FORWARDS, "postgresql": POSTGRES_FORWARDS}),
+            _run({"sqlite": SQLITE_BACKWARDS, "postgresql": POSTGRES_BACKWARDS}),
+            atomic=False,
+        ),
+        migrations.CreateModel(
+            name='SubmissionSearchEntry',
+            fields=[
+                ('submission', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='widget.submitteddata')),
+                ('widget', models.TextField()),
+                ('body', models.TextField()),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'widget_submission_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0089_submission_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WidgetRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('widget_id', models.UUIDField()),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('submissions', models.PositiveIntegerField(default=0)),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('files', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('widget_id', 'period', 'start'), name='widgetrollup_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:04
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0090_widget_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('format', models.CharField(choices=[('csv', 'CSV')], default='csv', max_length=16)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('fingerprint', models.CharField(max_length=100)),
+                ('file', models.FileField(blank=True, max_length=255, upload_to='widget/exports')),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('rows_total', models.PositiveIntegerField(default=0)),
+                ('rows_written', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('widget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='widget.widgetdata')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['widget', 'format', 'fingerprint'], name='exportjob_widget_fingerprint')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+from widget.operations import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('widget', '0091_export_jobs'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='submitteddata',
+            index=models.Index(fields=['widget', 'id'], name='submitteddata_widget_id'),
+        ),
+    ]
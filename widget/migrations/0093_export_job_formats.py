@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0092_submitteddata_widget_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='format',
+            field=models.CharField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON'), ('xlsx', 'Excel (XLSX)'), ('parquet', 'Parquet')], default='csv', max_length=16),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0093_export_job_formats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SheetRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=64)),
+                ('widget_id', models.UUIDField()),
+                ('header', models.JSONField()),
+                ('values', models.JSONField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['widget_id', 'id'], name='sheetrow_widget')],
+            },
+        ),
+    ]
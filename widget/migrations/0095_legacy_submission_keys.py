@@ -0,0 +1,57 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 5000
+
+
+def backfill_legacy_keys(apps, schema_editor):
+    # Collects the keys of submissions stored without a schema; each batch
+    # commits on its own so no long-lived lock is held.
+    SubmittedData = apps.get_model("widget", "SubmittedData")
+    LegacySubmissionKey = apps.get_model("widget", "LegacySubmissionKey")
+    last_pk = 0
+    while True:
+        rows = list(
+            SubmittedData.objects.filter(pk__gt=last_pk, schema__isnull=True)
+            .order_by("pk")
+            .values_list("pk", "widget_id", "data")[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        keys = {
+            (widget_id, key)
+            for _, widget_id, data in rows
+            if isinstance(data, dict)
+            for key in data
+        }
+        LegacySubmissionKey.objects.bulk_create(
+            [LegacySubmissionKey(widget_id=w, key=k) for w, k in keys],
+            ignore_conflicts=True,
+        )
+        last_pk = rows[-1][0]
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('widget', '0094_sheet_rows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LegacySubmissionKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.TextField()),
+                ('widget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legacy_keys', to='widget.widgetdata')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('widget', 'key'), name='legacysubmissionkey_widget_key')],
+            },
+        ),
+        migrations.RunPython(
+            backfill_legacy_keys, migrations.RunPython.noop, atomic=False
+        ),
+    ]
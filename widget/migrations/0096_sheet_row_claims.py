@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('widget', '0095_legacy_submission_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sheetrow',
+            name='claimed_by',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sheetrow',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
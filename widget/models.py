@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Greatest, Now
 from django.core.validators import (
     URLValidator,
     validate_email,
@@ -7,9 +8,14 @@ from django.core.validators import (
     MaxValueValidator,
 )
 from django.conf import settings
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 from zoneinfo import available_timezones
+from collections import Counter
+from datetime import timezone as dt_timezone
 from uuid import uuid4
+import hashlib
+import os
 from widget.validators import validate_time_ranges
 import re
 
@@ -309,6 +315,30 @@ class FormBuilderLayout(models.Model):
     navigation = models.OneToOneField(Navigation, on_delete=models.SET_NULL, null=True)
 
 
+class WidgetDataQuerySet(models.QuerySet):
+    def with_graph(self):
+        return (
+            self.select_related(
+                "title_style",
+                "header__cover_image",
+                "layout__navigation",
+                "theme__gradient",
+                "theme__corner_radius",
+                "theme__dark_mode__gradient",
+                "display_settings__mode",
+                "display_settings__position",
+                "display_settings__button_style",
+                "display_settings__background__image_settings",
+                "submit_button__spacing",
+                "submit_button__colors__hover",
+                "footer",
+                "email_notification",
+                "user_brand_info",
+            )
+            .prefetch_related("pre_fill", "layout__pages")
+        )
+
+
 class WidgetData(models.Model):
     WIDGET_CONTACT_FORM = "CONTACT_US"
     WIDGET_FORM_BUILDER = "FORM"
@@ -339,6 +369,7 @@ class WidgetData(models.Model):
         FormBuilderLayout, on_delete=models.SET_NULL, null=True
     )
     script = models.TextField(null=True, blank=True)
+    script_hash = models.CharField(max_length=16, null=True, blank=True)
     widget_fields = models.JSONField(default=list)
     integration_google_sheets_id = models.CharField(
         max_length=255, blank=True, null=True
@@ -370,12 +401,118 @@ class WidgetData(models.Model):
     footer = models.OneToOneField(Footer, on_delete=models.SET_NULL, null=True)
     custom_js = models.TextField(null=True, blank=True)
     custom_css = models.TextField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=1)
+    total_submissions = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = WidgetDataQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self.script_hash = (
+            hashlib.sha256(self.script.encode()).hexdigest()[:16]
+            if self.script
+            else None
+        )
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+
+        # total_submissions is maintained with atomic updates and is never
+        # written back from a possibly stale instance.
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            update_fields = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+            ]
+        update_fields = {*update_fields, "version"} - {"total_submissions"}
+        if "script" in update_fields:
+            update_fields.add("script_hash")
+        kwargs["update_fields"] = update_fields
+        self.version = models.F("version") + 1
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=["version", "total_submissions"])
+
+    @classmethod
+    def add_submissions(cls, widget_id, count=1):
+        cls.objects.filter(pk=widget_id).update(
+            total_submissions=Greatest(
+                models.F("total_submissions") + count, 0
+            )
+        )
+
+
+def blob_path(instance, filename):
+    digest = instance.sha256
+    extension = os.path.splitext(filename)[1].lower()[:16]
+    return f"widget/blobs/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+class FileBlob(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_path, max_length=255)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=255, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    last_referenced_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def add_references(cls, blob_id, count=1):
+        cls.objects.filter(pk=blob_id).update(
+            ref_count=Greatest(models.F("ref_count") + count, 0),
+            last_referenced_at=timezone.now(),
+        )
+
 
 class WidgetFile(models.Model):
     widget = models.ForeignKey(WidgetData, on_delete=models.CASCADE)
-    file = models.FileField(upload_to="widget/files")
+    file = models.FileField(upload_to="widget/files", max_length=255)
+    blob = models.ForeignKey(
+        FileBlob, null=True, blank=True, on_delete=models.PROTECT, related_name="+"
+    )
+    field_id = models.CharField(max_length=100, blank=True)
+    name = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding and self.blob_id:
+            FileBlob.add_references(self.blob_id)
+        if adding:
+            WidgetRollup.add(self.widget_id, "files", [self.created_at])
+
+
+class WidgetSchema(models.Model):
+    # The value-carrying fields of a widget at one point in time. Submissions
+    # store their values positionally against one of these.
+    widget = models.ForeignKey(
+        WidgetData, on_delete=models.CASCADE, related_name="schemas"
+    )
+    version = models.PositiveIntegerField()
+    fields = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["widget", "version"], name="widgetschema_widget_version"
+            ),
+        ]
+
+
+class SubmittedDataQuerySet(models.QuerySet):
+    def delete(self):
+        counts = list(
+            self.order_by()
+            .values("widget_id")
+            .annotate(count=models.Count("pk"))
+            .values_list("widget_id", "count")
+        )
+        deleted = super().delete()
+        for widget_id, count in counts:
+            WidgetData.add_submissions(widget_id, -count)
+        return deleted
 
 
 class SubmittedData(models.Model):
@@ -384,7 +521,230 @@ class SubmittedData(models.Model):
         on_delete=models.CASCADE,
         related_name="form_data",
     )
+    # A list of values ordered like ``schema.fields``, or a label-keyed dict
+    # for submissions stored before schemas existed.
     data = models.JSONField()
+    schema = models.ForeignKey(
+        WidgetSchema, null=True, blank=True, on_delete=models.RESTRICT, related_name="+"
+    )
+    # Set for submissions accepted through the ingest buffer so a replayed
+    # spool file does not insert them twice.
+    ingest_key = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+    # db_default covers inserts by code that predates the field.
+    created_at = models.DateTimeField(default=timezone.now, db_default=Now())
+
+    objects = SubmittedDataQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["widget", "created_at", "id"],
+                name="submitteddata_widget_created",
+            ),
+            # Delta exports range over ids within a widget.
+            models.Index(fields=["widget", "id"], name="submitteddata_widget_id"),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            WidgetData.add_submissions(self.widget_id)
+            WidgetRollup.add(self.widget_id, "submissions", [self.created_at])
+        if self.schema_id is None and isinstance(self.data, dict):
+            LegacySubmissionKey.add(self.widget_id, self.data)
+
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        WidgetData.add_submissions(self.widget_id, -1)
+        return deleted
+
+
+class LegacySubmissionKey(models.Model):
+    # The data keys of a widget's submissions stored before schemas existed,
+    # so exports know their columns without reading those rows. Kept up to
+    # date by SubmittedData.save; keys of deleted rows are not removed.
+    widget = models.ForeignKey(
+        WidgetData, on_delete=models.CASCADE, related_name="legacy_keys"
+    )
+    key = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["widget", "key"], name="legacysubmissionkey_widget_key"
+            ),
+        ]
+
+    @classmethod
+    def add(cls, widget_id, keys):
+        cls.objects.bulk_create(
+            [cls(widget_id=widget_id, key=key) for key in keys],
+            ignore_conflicts=True,
+        )
+
+
+class SubmissionSearchEntry(models.Model):
+    # The SQLite FTS5 table that triggers keep in step with SubmittedData
+    # (migration 0089). Postgres searches an expression index instead.
+    submission = models.OneToOneField(
+        SubmittedData,
+        primary_key=True,
+        db_column="rowid",
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name="search_entry",
+    )
+    widget = models.TextField()
+    body = models.TextField()
+    # FTS5's hidden bm25() column; lower is a better match.
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "widget_submission_fts"
+
+
+class WidgetRollup(models.Model):
+    # Activity counts per widget and UTC hour or day, bumped as data arrives
+    # (widget.rollups) and rebuilt from stored rows by backfill_rollups.
+    # widget_id is a WidgetData or an AppointmentWidget.
+    HOUR = "hour"
+    DAY = "day"
+    PERIOD_CHOICES = [(HOUR, "Hour"), (DAY, "Day")]
+    METRICS = ["submissions", "bookings", "files"]
+
+    widget_id = models.UUIDField()
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    start = models.DateTimeField()
+    submissions = models.PositiveIntegerField(default=0)
+    bookings = models.PositiveIntegerField(default=0)
+    files = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["widget_id", "period", "start"], name="widgetrollup_bucket"
+            ),
+        ]
+
+    @classmethod
+    def bucket(cls, moment, period):
+        start = moment.astimezone(dt_timezone.utc).replace(
+            minute=0, second=0, microsecond=0
+        )
+        return start.replace(hour=0) if period == cls.DAY else start
+
+    @classmethod
+    def add(cls, widget_id, metric, moments):
+        # Counts one ``metric`` event per moment into its hour and day.
+        counts = Counter(
+            (period, cls.bucket(moment, period))
+            for moment in moments
+            for period in (cls.HOUR, cls.DAY)
+        )
+        for (period, start), count in counts.items():
+            bucket = cls.objects.filter(widget_id=widget_id, period=period, start=start)
+            if bucket.update(**{metric: models.F(metric) + count}):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        widget_id=widget_id, period=period, start=start, **{metric: count}
+                    )
+            except IntegrityError:
+                # Created concurrently.
+                bucket.update(**{metric: models.F(metric) + count})
+
+
+class ExportJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+    CSV = "csv"
+    NDJSON = "ndjson"
+    XLSX = "xlsx"
+    PARQUET = "parquet"
+    # XLSX and Parquet also need openpyxl and pyarrow (widget.exports).
+    FORMAT_CHOICES = [
+        (CSV, "CSV"),
+        (NDJSON, "NDJSON"),
+        (XLSX, "Excel (XLSX)"),
+        (PARQUET, "Parquet"),
+    ]
+
+    id = models.UUIDField(default=uuid4, primary_key=True)
+    widget = models.ForeignKey(
+        WidgetData, on_delete=models.CASCADE, related_name="export_jobs"
+    )
+    format = models.CharField(max_length=16, choices=FORMAT_CHOICES, default=CSV)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    # What the widget's data looked like when the job was requested; a job
+    # with the same fingerprint is reused instead of exporting again.
+    fingerprint = models.CharField(max_length=100)
+    file = models.FileField(upload_to="widget/exports", max_length=255, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["widget", "format", "fingerprint"],
+                name="exportjob_widget_fingerprint",
+            ),
+        ]
+
+
+class SheetRow(models.Model):
+    # A row waiting to be appended to a widget's Google Sheet. Rows are
+    # persisted so a crashed flush resumes, and appended in id order by
+    # widget.sheets. widget_id is a WidgetData or an AppointmentWidget.
+    model_name = models.CharField(max_length=64)
+    widget_id = models.UUIDField()
+    # Written as the first row if the spreadsheet still has to be created.
+    header = models.JSONField()
+    values = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    # Set while a flusher is appending the row; a lease past claimed_until
+    # was left by a flusher that died and may be taken over.
+    claimed_by = models.UUIDField(null=True, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["widget_id", "id"], name="sheetrow_widget"),
+        ]
+
+
+class SubmissionRateLimit(models.Model):
+    # Per-owner overrides for the public submission throttle; empty fields
+    # fall back to WIDGET_SUBMISSION_THROTTLE.
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="submission_rate_limit",
+    )
+    widget_rate = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Submissions per minute for each widget."
+    )
+    widget_burst = models.PositiveIntegerField(null=True, blank=True)
+    ip_rate = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Submissions per minute from one client IP to each widget.",
+    )
+    ip_burst = models.PositiveIntegerField(null=True, blank=True)
 
 
 class PreFill(models.Model):
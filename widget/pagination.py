@@ -0,0 +1,134 @@
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class SubmissionCursorPagination(BasePagination):
+    # Keyset pagination over (created_at, id), newest first. Each page is one
+    # range scan of the (widget, created_at, id) index however many rows the
+    # widget has. Expects a values() queryset that includes both columns.
+    ordering = "created_at"
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position, backwards = self.decode_cursor(request)
+
+        field = self.ordering
+        if position is None:
+            rows = list(queryset.order_by(f"-{field}", "-id")[: self.page_size + 1])
+        elif backwards:
+            value, pk = position
+            rows = list(
+                queryset.filter(
+                    Q(**{f"{field}__gt": value}) | Q(**{field: value, "id__gt": pk})
+                ).order_by(field, "id")[: self.page_size + 1]
+            )
+        else:
+            value, pk = position
+            rows = list(
+                queryset.filter(
+                    Q(**{f"{field}__lt": value}) | Q(**{field: value, "id__lt": pk})
+                ).order_by(f"-{field}", "-id")[: self.page_size + 1]
+            )
+
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if backwards:
+            rows.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.first = rows[0] if rows else None
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            value, pk, backwards = json.loads(
+                base64.urlsafe_b64decode(encoded.encode())
+            )
+            return (self.parse_value(value), int(pk)), bool(backwards)
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def parse_value(self, value):
+        created_at = parse_datetime(value)
+        if created_at is None:
+            raise ValueError
+        return created_at
+
+    def format_value(self, value):
+        return value.isoformat()
+
+    def encode_cursor(self, row, backwards):
+        payload = json.dumps(
+            [self.format_value(row[self.ordering]), row["id"], backwards]
+        )
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            base64.urlsafe_b64encode(payload.encode()).decode(),
+        )
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first is None:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.encode_cursor(self.first, True)
+
+    def get_paginated_response(self, data, **extra):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                **extra,
+                "results": data,
+            }
+        )
+
+
+class SubmissionSearchPagination(SubmissionCursorPagination):
+    # Keyset pagination over (rank, id), best match first. Ranks depend on
+    # the whole index, so rows inserted while paging can shift the order
+    # slightly.
+    ordering = "rank"
+
+    def parse_value(self, value):
+        return float(value)
+
+    def format_value(self, value):
+        return value
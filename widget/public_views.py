@@ -0,0 +1,54 @@
+import uuid
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from widget.models import AppointmentWidget, Container, PricingWidgetV2, WidgetData
+from widget.snapshots import load_snapshot, snapshot_response
+
+
+def public_read(model, fallback, not_found):
+    # Anonymous reads are answered from the snapshot bytes without going
+    # through DRF; writes and authenticated requests still use ``fallback``.
+
+    @csrf_exempt
+    def view(request, **kwargs):
+        if (
+            request.method not in ("GET", "HEAD")
+            or "HTTP_AUTHORIZATION" in request.META
+        ):
+            return fallback(request, **kwargs)
+
+        # Cached under the canonical spelling, which invalidation uses.
+        try:
+            pk = uuid.UUID(str(kwargs.get("uuid", kwargs.get("pk"))))
+        except ValueError:
+            return JsonResponse(not_found, status=404)
+        snapshot = load_snapshot(model, pk, request)
+        if snapshot is None:
+            return JsonResponse(not_found, status=404)
+        return snapshot_response(request, snapshot)
+
+    return view
+
+
+def widget_config(fallback):
+    return public_read(WidgetData, fallback, {"error": "Widget not found."})
+
+
+def pricing_config(fallback):
+    return public_read(Container, fallback, {"error": "Widget not found."})
+
+
+def booking_config(fallback):
+    return public_read(
+        AppointmentWidget, fallback, {"error": "widget doesn't exist"}
+    )
+
+
+def pricing_v2_config(fallback):
+    return public_read(
+        PricingWidgetV2,
+        fallback,
+        {"detail": "No PricingWidgetV2 matches the given query."},
+    )
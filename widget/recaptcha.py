@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+
+VERIFY_URL = getattr(
+    settings,
+    "RECAPTCHA_VERIFY_URL",
+    "https://www.google.com/recaptcha/api/siteverify",
+)
+# (connect, read) seconds.
+TIMEOUT = getattr(settings, "RECAPTCHA_TIMEOUT", (1.0, 3.0))
+POOL_SIZE = getattr(settings, "RECAPTCHA_POOL_SIZE", 10)
+MAX_CONCURRENCY = getattr(settings, "RECAPTCHA_MAX_CONCURRENCY", 10)
+QUEUE_TIMEOUT = getattr(settings, "RECAPTCHA_QUEUE_TIMEOUT", 0.5)
+# Tokens are single-use at Google and expire after two minutes, so a retried
+# submission is answered from here instead of failing as a duplicate. Only
+# retries within the same scope (see RecaptchaVerifier.verify) are answered.
+TOKEN_CACHE_TIMEOUT = getattr(settings, "RECAPTCHA_TOKEN_CACHE_TIMEOUT", 120)
+FAILURE_THRESHOLD = getattr(settings, "RECAPTCHA_FAILURE_THRESHOLD", 5)
+RECOVERY_TIMEOUT = getattr(settings, "RECAPTCHA_RECOVERY_TIMEOUT", 30)
+# Whether submissions are accepted while the verifier is unavailable.
+FAIL_OPEN = getattr(settings, "RECAPTCHA_FAIL_OPEN", False)
+
+
+class VerifierUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, recovery_timeout):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+            # Half-open: let a single request through to probe the verifier.
+            if self.trial_running:
+                return False
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class RecaptchaVerifier:
+    def __init__(self, url=None, secret=None):
+        self.url = url or VERIFY_URL
+        self.secret = secret
+        self.session = requests.Session()
+        self.session.mount(
+            "https://", HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        )
+        self.session.mount(
+            "http://", HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        )
+        self.slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(FAILURE_THRESHOLD, RECOVERY_TIMEOUT)
+
+    def cache_key(self, token, scope):
+        digest = hashlib.sha256(f"{scope}:{token}".encode()).hexdigest()
+        return f"widget:recaptcha:{digest}"
+
+    def verify(self, token, remote_ip=None, scope=None):
+        # ``scope`` names the one submission a token may be reused for, e.g.
+        # its widget and Idempotency-Key. Without one the result is not
+        # cached, so Google's single-use check applies to every request.
+        key = None if scope is None else self.cache_key(token, scope)
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        try:
+            success = self._request(token, remote_ip)
+        except VerifierUnavailable:
+            return FAIL_OPEN
+        if key is not None:
+            cache.set(key, success, TOKEN_CACHE_TIMEOUT)
+        return success
+
+    def _request(self, token, remote_ip):
+        # Shedding load is not the verifier's fault, so the slot is taken
+        # before the breaker is consulted.
+        if not self.slots.acquire(timeout=QUEUE_TIMEOUT):
+            raise VerifierUnavailable("too many concurrent verifications")
+        if not self.breaker.allow():
+            self.slots.release()
+            raise VerifierUnavailable("circuit open")
+
+        data = {
+            "secret": self.secret or settings.RECAPTCHA_SECRET_KEY,
+            "response": token,
+        }
+        if remote_ip:
+            data["remoteip"] = remote_ip
+        try:
+            response = self.session.post(self.url, data=data, timeout=TIMEOUT)
+            response.raise_for_status()
+            result = response.json()
+        except (requests.RequestException, ValueError) as exc:
+            self.breaker.record_failure()
+            raise VerifierUnavailable(str(exc)) from exc
+        finally:
+            self.slots.release()
+
+        self.breaker.record_success()
+        return bool(result.get("success", False))
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = RecaptchaVerifier()
+    return _verifier
+
+
+def verify(token, remote_ip=None, scope=None):
+    return get_verifier().verify(token, remote_ip, scope)
@@ -0,0 +1,80 @@
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+
+from widget.models import SubmittedData, WidgetFile, WidgetRollup
+
+
+STEPS = {WidgetRollup.HOUR: timedelta(hours=1), WidgetRollup.DAY: timedelta(days=1)}
+DEFAULT_BUCKETS = {WidgetRollup.HOUR: 48, WidgetRollup.DAY: 30}
+MAX_BUCKETS = getattr(settings, "WIDGET_STATS_MAX_BUCKETS", 400)
+
+
+def series(widget_id, period, since, until):
+    # Dense, column-oriented counts for [since, until), one entry per bucket.
+    step = STEPS[period]
+    first = WidgetRollup.bucket(since, period)
+    rows = {
+        row["start"]: row
+        for row in WidgetRollup.objects.filter(
+            widget_id=widget_id, period=period, start__gte=first, start__lt=until
+        ).values("start", *WidgetRollup.METRICS)
+    }
+    columns = {"start": [], **{metric: [] for metric in WidgetRollup.METRICS}}
+    start = first
+    while start < until:
+        row = rows.get(start, {})
+        columns["start"].append(start)
+        for metric in WidgetRollup.METRICS:
+            columns[metric].append(row.get(metric, 0))
+        start += step
+    return columns
+
+
+def _counts(queryset, period):
+    trunc = TruncHour if period == WidgetRollup.HOUR else TruncDay
+    return (
+        queryset.annotate(start=trunc("created_at", tzinfo=dt_timezone.utc))
+        .values("widget_id", "start")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+
+
+def rebuild(widget_ids, since=None):
+    # Recomputes submission and file buckets from stored rows. Bookings are
+    # not stored anywhere, so their counts are kept as they are.
+    submissions = SubmittedData.objects.filter(widget_id__in=widget_ids)
+    files = WidgetFile.objects.filter(widget_id__in=widget_ids, created_at__isnull=False)
+    if since is not None:
+        since = WidgetRollup.bucket(since, WidgetRollup.DAY)
+        submissions = submissions.filter(created_at__gte=since)
+        files = files.filter(created_at__gte=since)
+
+    with transaction.atomic():
+        existing = WidgetRollup.objects.filter(widget_id__in=widget_ids)
+        if since is not None:
+            existing = existing.filter(start__gte=since)
+        existing.update(submissions=0, files=0)
+        for period in STEPS:
+            buckets = {}
+            for metric, queryset in (("submissions", submissions), ("files", files)):
+                for row in _counts(queryset, period):
+                    key = (row["widget_id"], row["start"])
+                    buckets.setdefault(key, {})[metric] = row["count"]
+            WidgetRollup.objects.bulk_create(
+                [
+                    WidgetRollup(
+                        widget_id=widget_id, period=period, start=start, **metrics
+                    )
+                    for (widget_id, start), metrics in buckets.items()
+                ],
+                update_conflicts=True,
+                unique_fields=["widget_id", "period", "start"],
+                update_fields=["submissions", "files"],
+                batch_size=1000,
+            )
+        existing.filter(submissions=0, bookings=0, files=0).delete()
@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from widget.models import WidgetSchema
+from widget.validation import stored_fields
+
+
+REGISTRY_CACHE_SIZE = getattr(settings, "WIDGET_SCHEMA_CACHE_SIZE", 1024)
+
+# Field types that never produce a stored value.
+VALUELESS_TYPES = {"file", "consent"}
+
+
+def schema_fields(widget_fields):
+    return [
+        {"id": field["id"], "label": field.get("label"), "type": field["type"]}
+        for field in widget_fields
+        if field["type"] not in VALUELESS_TYPES
+    ]
+
+
+class SchemaRegistry:
+    # Every schema version of one widget. Labels are resolved through the
+    # newest version that has the field, so renaming a label keeps older
+    # submissions in the same column.
+    def __init__(self, schemas):
+        self.schemas = {schema.pk: schema for schema in schemas}
+        self.labels = {}
+        for schema in sorted(schemas, key=lambda schema: schema.version):
+            for field in schema.fields:
+                self.labels[field["id"]] = field["label"]
+        self.current = max(schemas, key=lambda schema: schema.version, default=None)
+
+    def decode(self, schema_id, data):
+        if schema_id is None:
+            return data
+        schema = self.schemas[schema_id]
+        return {
+            self.labels[field["id"]]: value
+            for field, value in zip(schema.fields, data)
+            if value is not None
+        }
+
+    def columns(self):
+        # Labels in form order, newest schema first, followed by fields that
+        # only older versions had.
+        columns = []
+        seen = set()
+        for schema in sorted(
+            self.schemas.values(), key=lambda schema: schema.version, reverse=True
+        ):
+            for field in schema.fields:
+                label = self.labels[field["id"]]
+                if label not in seen:
+                    seen.add(label)
+                    columns.append(label)
+        return columns
+
+    def projection(self, schema_id, columns):
+        # For each column, its index in payloads of ``schema_id`` or None.
+        indexes = {
+            self.labels[field["id"]]: index
+            for index, field in enumerate(self.schemas[schema_id].fields)
+        }
+        return [indexes.get(column) for column in columns]
+
+    def positions(self, label):
+        return [
+            (schema_id, index)
+            for schema_id, schema in self.schemas.items()
+            for index, field in enumerate(schema.fields)
+            if self.labels[field["id"]] == label
+        ]
+
+
+_registries = OrderedDict()
+_registries_lock = threading.Lock()
+
+
+def _remember(key, registry):
+    with _registries_lock:
+        _registries[key] = registry
+        _registries.move_to_end(key)
+        while len(_registries) > REGISTRY_CACHE_SIZE:
+            _registries.popitem(last=False)
+    return registry
+
+
+def get_registry(widget, schema_ids=()):
+    # Keyed by widget version: editing widget_fields bumps it. A schema id
+    # the cached registry does not know (registered by another process)
+    # forces a reload.
+    key = (widget.pk, widget.version)
+    with _registries_lock:
+        registry = _registries.get(key)
+    if registry is not None and all(
+        pk is None or pk in registry.schemas for pk in schema_ids
+    ):
+        return registry
+    return _remember(
+        key, SchemaRegistry(list(WidgetSchema.objects.filter(widget_id=widget.pk)))
+    )
+
+
+def get_schema(widget):
+    fields = schema_fields(stored_fields(widget.widget_fields))
+    registry = get_registry(widget)
+    while registry.current is None or registry.current.fields != fields:
+        version = registry.current.version + 1 if registry.current else 1
+        try:
+            with transaction.atomic():
+                WidgetSchema.objects.create(
+                    widget=widget, version=version, fields=fields
+                )
+        except IntegrityError:
+            # Another process registered this version first; check whether
+            # it matches before trying the next one.
+            pass
+        registry = _remember(
+            (widget.pk, widget.version),
+            SchemaRegistry(list(WidgetSchema.objects.filter(widget_id=widget.pk))),
+        )
+    return registry.current
+
+
+def encode(schema, field_values):
+    values = {item["id"]: item["value"] for item in field_values}
+    return [values.get(field["id"]) for field in schema.fields]
@@ -0,0 +1,79 @@
+import gzip
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+try:
+    import brotli
+except ImportError:  # brotli variants are only published when it is installed
+    brotli = None
+
+
+SCRIPT_STORAGE_DIR = "widget/scripts"
+
+# Preferred order when the client accepts several encodings.
+SCRIPT_ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def script_dir(widget_id):
+    # One directory per widget so its old versions can be found and removed.
+    return f"{SCRIPT_STORAGE_DIR}/{widget_id}"
+
+
+def script_path(widget_id, script_hash, suffix=""):
+    return f"{script_dir(widget_id)}/{script_hash}.js{suffix}"
+
+
+def remove_scripts(widget_id, keep=None):
+    # Deletes every published version of the widget's script except ``keep``.
+    directory = script_dir(widget_id)
+    try:
+        files = default_storage.listdir(directory)[1]
+    except FileNotFoundError:
+        return
+    for name in files:
+        if keep is None or name.split(".js", 1)[0] != keep:
+            default_storage.delete(f"{directory}/{name}")
+
+
+def _compress(encoding, data):
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, mode=brotli.MODE_TEXT)
+    return None
+
+
+def publish_script(widget):
+    if not widget.script_hash:
+        remove_scripts(widget.id)
+        return
+    path = script_path(widget.id, widget.script_hash)
+    if default_storage.exists(path):
+        return
+
+    data = widget.script.encode()
+    for encoding, suffix in SCRIPT_ENCODINGS:
+        variant_path = script_path(widget.id, widget.script_hash, suffix)
+        compressed = _compress(encoding, data)
+        if compressed is not None and not default_storage.exists(variant_path):
+            default_storage.save(variant_path, ContentFile(compressed))
+    # The identity variant is written last so its presence means the whole
+    # set has been published.
+    default_storage.save(path, ContentFile(data))
+    remove_scripts(widget.id, keep=widget.script_hash)
+
+
+def open_script(widget_id, script_hash, accept_encoding=""):
+    accepted = {
+        part.split(";")[0].strip().lower() for part in accept_encoding.split(",")
+    }
+    for encoding, suffix in SCRIPT_ENCODINGS:
+        path = script_path(widget_id, script_hash, suffix)
+        if encoding in accepted and default_storage.exists(path):
+            return default_storage.open(path), encoding
+
+    path = script_path(widget_id, script_hash)
+    if default_storage.exists(path):
+        return default_storage.open(path), None
+    return None, None
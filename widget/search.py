@@ -0,0 +1,69 @@
+from django.db import connection
+from django.db.models import BooleanField, F, FloatField, Lookup, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from widget.models import SubmissionSearchEntry
+
+
+# Maintained by triggers on SQLite and by an expression index on Postgres;
+# see migration 0089.
+POSTGRES_VECTOR = (
+    "jsonb_to_tsvector('simple', widget_submitteddata.data, "
+    "'[\"string\", \"numeric\"]')"
+)
+POSTGRES_QUERY = "websearch_to_tsquery('simple', %s)"
+
+
+class Match(Lookup):
+    # ``<fts table> MATCH <query>``, for a column of SubmissionSearchEntry.
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        rhs, params = self.process_rhs(compiler, connection)
+        table = compiler.quote_name_unless_alias(self.lhs.alias)
+        return f"{table} MATCH {rhs}", params
+
+
+SubmissionSearchEntry._meta.get_field("body").register_lookup(Match)
+
+
+def _fts5_query(widget_id, text):
+    terms = " ".join(
+        '"{}"'.format(term.replace('"', '""')) for term in text.split()
+    )
+    return f'widget : "{widget_id.hex}" AND body : ({terms})'
+
+
+def search(queryset, widget_id, text):
+    # Filters submissions to those whose values match every term of ``text``
+    # and annotates ``rank`` (higher is better).
+    if not text.split():
+        return queryset.none()
+    if connection.vendor == "postgresql":
+        queryset = queryset.filter(
+            RawSQL(
+                f"{POSTGRES_VECTOR} @@ {POSTGRES_QUERY}",
+                [text],
+                output_field=BooleanField(),
+            )
+        )
+        return queryset.annotate(
+            rank=RawSQL(
+                f"ts_rank({POSTGRES_VECTOR}, {POSTGRES_QUERY})",
+                [text],
+                output_field=FloatField(),
+            )
+        )
+    if connection.vendor == "sqlite":
+        # Joining the FTS table runs the MATCH once and exposes bm25() as
+        # its hidden rank column.
+        queryset = queryset.filter(
+            search_entry__body__match=_fts5_query(widget_id, text)
+        )
+        return queryset.annotate(rank=-F("search_entry__rank"))
+    # No full-text index on other backends: scan the widget's submissions.
+    queryset = queryset.annotate(search_text=Cast("data", TextField()))
+    for term in text.split():
+        queryset = queryset.filter(search_text__icontains=term)
+    return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
@@ -1,5 +1,9 @@
 from django.conf import settings
+from django.urls import reverse
 from rest_framework import serializers
+from widget.brand import get_admin_brand_info
+from widget.exports import EXPORT_FORMATS
+from widget.validation import compile_plan
 from widget.models import (
     AdminBrandInfo,
     AppointmentBackground,
@@ -38,6 +42,7 @@ from widget.models import (
     SpecialIntervals,
     SubmitButton,
     SubmittedData,
+    ExportJob,
     Theme,
     TitleStyle,
     WidgetData,
@@ -340,7 +345,6 @@ class FormBuilderLayoutSerializer(serializers.ModelSerializer):
 
 
 class WidgetSerializer(serializers.ModelSerializer):
-    total_submissions = serializers.SerializerMethodField()
     pre_fill_values = PreFillSerializer(source="pre_fill", many=True, required=False)
     pre_fill = serializers.ListField(
         child=serializers.DictField(child=serializers.CharField()),
@@ -351,6 +355,7 @@ class WidgetSerializer(serializers.ModelSerializer):
     admin_brand_info = AdminBrandInfoSerializer(read_only=True)
     user_brand_info = UserBrandInfoSerializer()
     script_url = serializers.SerializerMethodField()
+    bootstrap_url = serializers.SerializerMethodField()
     display_settings = DisplaySettingsSerializer()
     submit_button = SubmitButtonSerializer(required=False)
     theme = ThemeSerializer()
@@ -374,6 +379,7 @@ class WidgetSerializer(serializers.ModelSerializer):
             "html",
             "script",
             "script_url",
+            "bootstrap_url",
             "integration_google_sheets_id",
             "widget_fields",
             "redirect_url",
@@ -409,11 +415,24 @@ class WidgetSerializer(serializers.ModelSerializer):
     def get_script_url(self, obj):
         if not self.context.get("request"):
             return None
-        if obj.script:
+        if obj.script_hash:
             request = self.context.get("request")
-            return request.build_absolute_uri(f"/form-builder/script/{obj.id}.js")
+            return request.build_absolute_uri(
+                reverse("widget-script", args=[obj.id, obj.script_hash])
+            )
         return None
 
+    def get_bootstrap_url(self, obj):
+        request = self.context.get("request")
+        if not request:
+            return None
+        url = reverse("widget-bootstrap", args=[obj.id])
+        return request.build_absolute_uri(f"{url}?v={obj.version}")
+
+    def validate_widget_fields(self, value):
+        compile_plan(value)
+        return value
+
     def validate_pre_fill(self, value):
         for item in value:
             if not all(key in item for key in ["field_id", "parameter_name"]):
@@ -424,19 +443,18 @@ class WidgetSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        admin_brand_info = AdminBrandInfo.objects.first()
         representation["admin_brand_info"] = AdminBrandInfoSerializer(
-            admin_brand_info, context={"request": self.context.get("request")}
+            get_admin_brand_info(), context={"request": self.context.get("request")}
         ).data
 
         if not self.context.get("include_email_notification", True):
             representation.pop("email_notification", None)
             representation.pop("is_email_notification", None)
 
-        return representation
+        if self.context.get("public"):
+            representation.pop("total_submissions", None)
 
-    def get_total_submissions(self, obj):
-        return SubmittedData.objects.filter(widget=obj).count()
+        return representation
 
     def create(self, validated_data):
         email_notification_data = validated_data.pop("email_notification", None)
@@ -989,6 +1007,49 @@ class SubmittedDataSerializer(serializers.ModelSerializer):
         fields = ["id", "widget", "data"]
 
 
+class ExportJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = [
+            "id",
+            "format",
+            "status",
+            "progress",
+            "rows_total",
+            "rows_written",
+            "size",
+            "error",
+            "created_at",
+            "finished_at",
+            "download_url",
+        ]
+        read_only_fields = [field for field in fields if field != "format"]
+
+    def validate_format(self, value):
+        if value not in EXPORT_FORMATS:
+            raise serializers.ValidationError(
+                f"{value} exports are not available on this server."
+            )
+        return value
+
+    def get_progress(self, obj):
+        if obj.status == ExportJob.DONE:
+            return 1.0
+        if not obj.rows_total:
+            return 0.0
+        return min(obj.rows_written / obj.rows_total, 1.0)
+
+    def get_download_url(self, obj):
+        request = self.context.get("request")
+        if not request or obj.status != ExportJob.DONE:
+            return None
+        url = reverse("export-job-download", args=[obj.widget_id, obj.id])
+        return request.build_absolute_uri(url)
+
+
 class FormTemplateSerializer(serializers.ModelSerializer):
     submit_button = SubmitButtonSerializer()
 
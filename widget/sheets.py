@@ -0,0 +1,158 @@
+import uuid
+from datetime import timedelta
+
+from celery import shared_task
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from widget.models import SheetRow
+from widget.utils import create_sheet, write_sheet
+
+
+# A sheet is flushed once it has FLUSH_ROWS pending rows, or FLUSH_SECONDS
+# after its first pending row, whichever comes first.
+SHEETS_FLUSH_ROWS = getattr(settings, "WIDGET_SHEETS_FLUSH_ROWS", 100)
+SHEETS_FLUSH_SECONDS = getattr(settings, "WIDGET_SHEETS_FLUSH_SECONDS", 10)
+# Rows per values().append call.
+SHEETS_APPEND_ROWS = 1000
+# How long a flusher may spend appending a batch before another may take it.
+SHEETS_LEASE_SECONDS = getattr(settings, "WIDGET_SHEETS_LEASE_SECONDS", 300)
+
+
+def _key(name, widget_id):
+    return f"sheets:{name}:{widget_id}"
+
+
+def enqueue(model_name, widget_id, header, rows):
+    SheetRow.objects.bulk_create(
+        [
+            SheetRow(
+                model_name=model_name, widget_id=widget_id, header=header, values=values
+            )
+            for values in rows
+        ]
+    )
+    pending = SheetRow.objects.filter(widget_id=widget_id).count()
+    # The cache keys only stop every submission from scheduling its own
+    # task. Rows a lost or raced task leaves behind are picked up by the
+    # flush_sheet_rows command.
+    if pending >= SHEETS_FLUSH_ROWS and cache.add(
+        _key("due", widget_id), 1, SHEETS_FLUSH_SECONDS
+    ):
+        transaction.on_commit(
+            lambda: flush_sheet_rows.delay(model_name, str(widget_id))
+        )
+    elif cache.add(_key("scheduled", widget_id), 1, SHEETS_FLUSH_SECONDS):
+        transaction.on_commit(
+            lambda: flush_sheet_rows.apply_async(
+                (model_name, str(widget_id)), countdown=SHEETS_FLUSH_SECONDS
+            )
+        )
+
+
+def _claim(pending):
+    # Leases the oldest SHEETS_APPEND_ROWS rows in a short transaction, or
+    # returns None if another flusher holds them.
+    with transaction.atomic():
+        batch = list(
+            pending.select_for_update(skip_locked=True).values_list(
+                "id", "header", "values", "claimed_until"
+            )[:SHEETS_APPEND_ROWS]
+        )
+        head = pending.values_list("id", flat=True).first()
+        now = timezone.now()
+        if (
+            not batch
+            or batch[0][0] != head
+            or any(until and until > now for *_, until in batch)
+        ):
+            return None
+        claim = uuid.uuid4()
+        SheetRow.objects.filter(id__in=[row[0] for row in batch]).update(
+            claimed_by=claim,
+            claimed_until=now + timedelta(seconds=SHEETS_LEASE_SECONDS),
+        )
+    return claim, batch
+
+
+def flush(model_name, widget_id):
+    # Appends the widget's pending rows in order, SHEETS_APPEND_ROWS per API
+    # call. Each batch is leased, appended outside any transaction, then
+    # deleted, so no row lock is held across the Google call. A crash after
+    # the append appends that batch again once its lease runs out.
+    model = apps.get_model(model_name)
+    pending = SheetRow.objects.filter(widget_id=widget_id).order_by("id")
+    widget = model.objects.select_related("user").filter(pk=widget_id).first()
+    if widget is None:
+        pending.delete()
+        return 0
+
+    flushed = 0
+    while True:
+        claimed = _claim(pending)
+        if claimed is None:
+            return flushed
+        claim, batch = claimed
+        rows = [row[2] for row in batch]
+        try:
+            # Re-read so a sheet created by an earlier flusher is reused.
+            sheet_id = (
+                model.objects.filter(pk=widget_id)
+                .values_list("integration_google_sheets_id", flat=True)
+                .first()
+            )
+            if sheet_id:
+                write_sheet(widget.user, sheet_id, rows)
+            else:
+                sheet_id = create_sheet(widget.user, widget.name)
+                write_sheet(widget.user, sheet_id, [batch[0][1], *rows])
+                # Not widget.save(): that would write back a stale copy of
+                # the owner's settings and bump the widget's version.
+                model.objects.filter(pk=widget_id).update(
+                    integration_google_sheets_id=sheet_id
+                )
+        except Exception:
+            SheetRow.objects.filter(claimed_by=claim).update(
+                claimed_by=None, claimed_until=None
+            )
+            raise
+        with transaction.atomic():
+            SheetRow.objects.filter(claimed_by=claim).delete()
+        flushed += len(batch)
+
+
+def _pending(queryset):
+    return (
+        queryset.values("widget_id", "model_name")
+        .annotate(pending_rows=Count("id"), oldest=Min("created_at"))
+        .order_by()
+    )
+
+
+def lag(widget_id):
+    # How far the widget's sheet is behind its submissions.
+    row = next(iter(_pending(SheetRow.objects.filter(widget_id=widget_id))), None)
+    if row is None:
+        return {"pending_rows": 0, "lag_seconds": 0}
+    return {
+        "pending_rows": row["pending_rows"],
+        "lag_seconds": (timezone.now() - row["oldest"]).total_seconds(),
+    }
+
+
+def due():
+    # Sheets whose oldest row has waited past SHEETS_FLUSH_SECONDS, e.g.
+    # because the task meant to flush it was lost with its worker.
+    cutoff = timezone.now() - timedelta(seconds=SHEETS_FLUSH_SECONDS)
+    return list(_pending(SheetRow.objects.all()).filter(oldest__lte=cutoff))
+
+
+@shared_task(
+    autoretry_for=(Exception,), retry_backoff=True, retry_backoff_max=600, max_retries=8
+)
+def flush_sheet_rows(model_name, widget_id):
+    flush(model_name, widget_id)
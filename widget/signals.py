@@ -0,0 +1,116 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from widget.brand import invalidate_admin_brand_info
+from widget.models import (
+    AdminBrandInfo,
+    AppointmentWidget,
+    ExportJob,
+    FileBlob,
+    SheetRow,
+    WidgetData,
+    WidgetFile,
+    WidgetRollup,
+)
+from widget.scripts import publish_script, remove_scripts
+from widget.snapshots import (
+    SNAPSHOT_GRAPHS,
+    drop_snapshots,
+    get_dependents,
+    get_m2m_throughs,
+    invalidate_dependents,
+    invalidate_snapshots,
+)
+
+
+def _published_changed(sender, instance, **kwargs):
+    drop_snapshots(sender, [instance.pk])
+
+
+def _related_changed(sender, instance, **kwargs):
+    invalidate_dependents(instance)
+
+
+def _related_deleted(sender, instance, **kwargs):
+    # The relation to the root is gone once the delete commits.
+    invalidate_dependents(instance, resolve=True)
+
+
+def _relation_changed(sender, instance, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_dependents(instance)
+
+
+for model in SNAPSHOT_GRAPHS:
+    post_save.connect(
+        _published_changed,
+        sender=model,
+        dispatch_uid=f"snapshot_publish_save_{model.__name__}",
+    )
+    post_delete.connect(
+        _published_changed,
+        sender=model,
+        dispatch_uid=f"snapshot_publish_delete_{model.__name__}",
+    )
+
+for model in get_dependents():
+    post_save.connect(
+        _related_changed, sender=model, dispatch_uid=f"snapshot_save_{model.__name__}"
+    )
+    pre_delete.connect(
+        _related_deleted,
+        sender=model,
+        dispatch_uid=f"snapshot_delete_{model.__name__}",
+    )
+
+for through in get_m2m_throughs():
+    m2m_changed.connect(
+        _relation_changed,
+        sender=through,
+        dispatch_uid=f"snapshot_m2m_{through.__name__}",
+    )
+
+
+@receiver(post_save, sender=AdminBrandInfo)
+@receiver(post_delete, sender=AdminBrandInfo)
+def admin_brand_info_changed(sender, instance, **kwargs):
+    # Once committed, so no worker caches the old row again in between.
+    transaction.on_commit(_admin_brand_info_committed)
+
+
+def _admin_brand_info_committed():
+    invalidate_admin_brand_info()
+    invalidate_snapshots(WidgetData, WidgetData.objects.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=WidgetData)
+def widget_saved(sender, instance, **kwargs):
+    publish_script(instance)
+
+
+@receiver(post_delete, sender=WidgetFile)
+def widget_file_deleted(sender, instance, **kwargs):
+    # Also runs for cascaded deletes, which bypass WidgetFile.delete().
+    if instance.blob_id:
+        FileBlob.add_references(instance.blob_id, -1)
+
+
+@receiver(post_delete, sender=WidgetData)
+def widget_script_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: remove_scripts(pk))
+
+
+@receiver(post_delete, sender=WidgetData)
+@receiver(post_delete, sender=AppointmentWidget)
+def widget_deleted(sender, instance, **kwargs):
+    # Rollups and buffered sheet rows reference widgets by id only.
+    WidgetRollup.objects.filter(widget_id=instance.pk).delete()
+    SheetRow.objects.filter(widget_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=ExportJob)
+def export_job_deleted(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.delete(save=False)
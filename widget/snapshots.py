@@ -0,0 +1,406 @@
+import hashlib
+import json
+import threading
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework.renderers import JSONRenderer
+
+from widget.models import (
+    AppointmentWidget,
+    Column,
+    Container,
+    PricingWidgetColumnV2,
+    PricingWidgetV2,
+    WidgetData,
+)
+from widget.serializers import (
+    AppointmentWidgetSerializer,
+    ContainerSerializer,
+    PricingWidgetV2Serializer,
+    WidgetSerializer,
+)
+
+
+SNAPSHOT_TIMEOUT = getattr(settings, "WIDGET_SNAPSHOT_TIMEOUT", 60 * 60 * 24)
+PUBLIC_CACHE_MAX_AGE = getattr(settings, "WIDGET_PUBLIC_CACHE_MAX_AGE", 60)
+
+# Lookups from each published model to every related object rendered into
+# its public representation. A change to any of them invalidates the snapshot.
+SNAPSHOT_GRAPHS = {
+    WidgetData: [
+        "title_style",
+        "header",
+        "header__cover_image",
+        "layout",
+        "layout__navigation",
+        "layout__pages",
+        "theme",
+        "theme__gradient",
+        "theme__corner_radius",
+        "theme__dark_mode",
+        "theme__dark_mode__gradient",
+        "display_settings",
+        "display_settings__mode",
+        "display_settings__position",
+        "display_settings__button_style",
+        "display_settings__background",
+        "display_settings__background__image_settings",
+        "submit_button",
+        "submit_button__spacing",
+        "submit_button__colors",
+        "submit_button__colors__hover",
+        "footer",
+        "user_brand_info",
+        "pre_fill",
+    ],
+    Container: [
+        "content",
+        "content__columns",
+        "content__columns__price",
+        "content__columns__button",
+        "content__columns__button__link",
+        "content__columns__features",
+        "content__columns__image_settings",
+        "content__columns__image_settings__custom_size",
+        "layout",
+        "appearance",
+        "appearance__title",
+        "appearance__feature",
+        "appearance__price",
+        "appearance__button",
+    ],
+    AppointmentWidget: [
+        "service",
+        "service__price",
+        "day_schedules",
+        "special_intervals",
+        "width",
+        "background",
+    ],
+    PricingWidgetV2: [
+        "settings",
+        "settings__language",
+        "settings__tables",
+        "settings__tables__head_features",
+        "settings__tables__columns",
+        "settings__tables__columns__features",
+        "settings__tables__columns__button_link",
+        "settings__tables__columns__price",
+        "settings__tables__columns__old_price",
+        "settings__width",
+        "settings__widget_title_text_style",
+        "settings__head_title_font",
+        "settings__title_font",
+        "settings__title_caption_font",
+        "settings__discount_font",
+        "settings__old_price_font",
+        "settings__price_caption_font",
+        "settings__price_font",
+        "settings__button",
+        "settings__button__font",
+        "settings__discount",
+    ],
+}
+
+# Extra encodings cached next to the JSON snapshot and dropped with it.
+SNAPSHOT_VARIANTS = {WidgetData: ["json", "bootstrap"]}
+
+_dependents = None
+_m2m_throughs = None
+# Invalidations queued by invalidate_dependents until the transaction commits.
+_pending = threading.local()
+
+# Passed as ``stamp`` when the caller has nothing to check against.
+UNCHECKED = object()
+
+
+def _walk_graphs():
+    for root, lookups in SNAPSHOT_GRAPHS.items():
+        for lookup in lookups:
+            model = root
+            for part in lookup.split("__"):
+                field = model._meta.get_field(part)
+                if field.many_to_many and not field.auto_created:
+                    yield None, field.remote_field.through
+                model = field.related_model
+            yield (root, lookup), model
+
+
+def get_dependents():
+    global _dependents
+    if _dependents is None:
+        dependents = {}
+        for dependency, model in _walk_graphs():
+            if dependency:
+                dependents.setdefault(model, []).append(dependency)
+        _dependents = dependents
+    return _dependents
+
+
+def get_m2m_throughs():
+    global _m2m_throughs
+    if _m2m_throughs is None:
+        _m2m_throughs = {
+            through for dependency, through in _walk_graphs() if dependency is None
+        }
+    return _m2m_throughs
+
+
+def snapshot_key(model, pk, variant="json"):
+    return f"widget:snapshot:{model._meta.label_lower}:{pk}:{variant}"
+
+
+def snapshot_keys(model, pk):
+    return [
+        snapshot_key(model, pk, variant)
+        for variant in SNAPSHOT_VARIANTS.get(model, ["json"])
+    ]
+
+
+def stamp_key(model, pk):
+    return f"widget:snapshot:{model._meta.label_lower}:{pk}:stamp"
+
+
+def get_snapshot(model, pk, variant="json"):
+    return cache.get(snapshot_key(model, pk, variant))
+
+
+def get_stamps(model, pks):
+    # Read before loading rows for a snapshot; a render whose stamp has since
+    # changed was made from data an invalidation already replaced.
+    keys = {stamp_key(model, pk): pk for pk in pks}
+    stamps = cache.get_many(keys)
+    return {pk: stamps.get(key) for key, pk in keys.items()}
+
+
+def drop_snapshots(model, pks):
+    cache.delete_many([key for pk in pks for key in snapshot_keys(model, pk)])
+    cache.set_many(
+        {stamp_key(model, pk): uuid4().hex for pk in pks}, SNAPSHOT_TIMEOUT
+    )
+
+
+def invalidate_snapshots(model, pks):
+    pks = list(pks)
+    if not pks:
+        return
+    if model is WidgetData:
+        WidgetData.objects.filter(pk__in=pks).update(version=F("version") + 1)
+    drop_snapshots(model, pks)
+
+
+def _flush_dependents():
+    changed = getattr(_pending, "changed", {})
+    roots = getattr(_pending, "roots", {})
+    _pending.changed, _pending.roots = {}, {}
+    for (root, lookup), pks in changed.items():
+        roots.setdefault(root, set()).update(
+            root.objects.filter(**{f"{lookup}__in": pks}).values_list(
+                "pk", flat=True
+            )
+        )
+    for root, pks in roots.items():
+        invalidate_snapshots(root, pks)
+
+
+def invalidate_dependents(instance, resolve=False):
+    # A nested save touches dozens of related rows. They are collected and
+    # their roots invalidated once, when the transaction commits (at once in
+    # autocommit). ``resolve`` looks the roots up now, for rows about to be
+    # deleted.
+    dependencies = get_dependents().get(type(instance), [])
+    if not dependencies:
+        return
+    if not hasattr(_pending, "changed"):
+        _pending.changed, _pending.roots = {}, {}
+    for root, lookup in dependencies:
+        if resolve:
+            _pending.roots.setdefault(root, set()).update(
+                root.objects.filter(**{lookup: instance.pk}).values_list(
+                    "pk", flat=True
+                )
+            )
+        else:
+            _pending.changed.setdefault((root, lookup), set()).add(instance.pk)
+    transaction.on_commit(_flush_dependents)
+
+
+def render_widget_snapshot(widget, request=None):
+    return WidgetSerializer(
+        widget,
+        context={
+            "include_email_notification": False,
+            "public": True,
+            "request": request,
+        },
+    ).data
+
+
+def render_container_snapshot(container, request=None):
+    return ContainerSerializer(
+        container, context={"request": request, "view_layout": False}
+    ).data
+
+
+def render_appointment_snapshot(appointment, request=None):
+    return AppointmentWidgetSerializer(appointment, context={"request": request}).data
+
+
+def render_pricing_v2_snapshot(pricing_widget, request=None):
+    return PricingWidgetV2Serializer(
+        pricing_widget, context={"request": request}
+    ).data
+
+
+SNAPSHOT_RENDERERS = {
+    WidgetData: render_widget_snapshot,
+    Container: render_container_snapshot,
+    AppointmentWidget: render_appointment_snapshot,
+    PricingWidgetV2: render_pricing_v2_snapshot,
+}
+
+
+def public_queryset(model):
+    if model is WidgetData:
+        return WidgetData.objects.with_graph()
+    if model is Container:
+        return Container.objects.select_related(
+            "content",
+            "layout",
+            "appearance__title",
+            "appearance__feature",
+            "appearance__price",
+            "appearance__button",
+        ).prefetch_related(
+            Prefetch(
+                "content__columns",
+                queryset=Column.objects.select_related(
+                    "price", "button__link", "image_settings__custom_size"
+                ).prefetch_related("features"),
+            )
+        )
+    if model is AppointmentWidget:
+        return AppointmentWidget.objects.select_related(
+            "service__price", "width", "background"
+        ).prefetch_related("day_schedules", "special_intervals")
+    if model is PricingWidgetV2:
+        return PricingWidgetV2.objects.select_related(
+            "settings__language",
+            "settings__width",
+            "settings__widget_title_text_style",
+            "settings__head_title_font",
+            "settings__title_font",
+            "settings__title_caption_font",
+            "settings__discount_font",
+            "settings__old_price_font",
+            "settings__price_caption_font",
+            "settings__price_font",
+            "settings__button__font",
+            "settings__discount",
+        ).prefetch_related(
+            "settings__tables__head_features",
+            Prefetch(
+                "settings__tables__columns",
+                queryset=PricingWidgetColumnV2.objects.select_related(
+                    "button_link", "price", "old_price"
+                ).prefetch_related("features"),
+            ),
+        )
+    return model.objects.all()
+
+
+def _store_snapshot(instance, body, variant="json", stamp=UNCHECKED):
+    snapshot = {
+        "version": getattr(instance, "version", None),
+        "etag": '"%s"' % hashlib.sha256(body).hexdigest()[:32],
+        "body": body,
+    }
+    model = type(instance)
+    key = snapshot_key(model, instance.pk, variant)
+    cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    if stamp is not UNCHECKED and cache.get(stamp_key(model, instance.pk)) != stamp:
+        # Invalidated while rendering; serve this once but do not keep it.
+        cache.delete(key)
+    return snapshot
+
+
+def publish_snapshot(instance, request=None, stamp=UNCHECKED):
+    body = JSONRenderer().render(SNAPSHOT_RENDERERS[type(instance)](instance, request))
+    return _store_snapshot(instance, body, stamp=stamp)
+
+
+def load_snapshot(model, pk, request=None):
+    snapshot = get_snapshot(model, pk)
+    if snapshot is None:
+        stamp = get_stamps(model, [pk])[pk]
+        try:
+            instance = public_queryset(model).get(pk=pk)
+        except model.DoesNotExist:
+            return None
+        snapshot = publish_snapshot(instance, request, stamp)
+    return snapshot
+
+
+def load_snapshots(model, pks, request=None):
+    keys = {snapshot_key(model, pk): pk for pk in pks}
+    snapshots = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = [pk for pk in pks if pk not in snapshots]
+    if missing:
+        stamps = get_stamps(model, missing)
+        for instance in public_queryset(model).filter(pk__in=missing):
+            snapshots[instance.pk] = publish_snapshot(
+                instance, request, stamps.get(instance.pk)
+            )
+    return snapshots
+
+
+def publish_bootstrap(widget, request=None, stamp=UNCHECKED):
+    config = get_snapshot(WidgetData, widget.pk) or publish_snapshot(
+        widget, request, stamp
+    )
+    pre_fill = {item.parameter_name: item.field_id for item in widget.pre_fill.all()}
+    body = b"".join(
+        [
+            b"(function(w){var b=w.__widgetBootstrap=w.__widgetBootstrap||{};b[",
+            json.dumps(str(widget.pk)).encode(),
+            b"]={version:%d,config:" % widget.version,
+            config["body"],
+            b",preFill:",
+            json.dumps(pre_fill, separators=(",", ":")).encode(),
+            b"};})(window);\n",
+            widget.script.encode() if widget.script else b"",
+        ]
+    )
+    return _store_snapshot(widget, body, "bootstrap", stamp)
+
+
+def load_bootstrap(pk, request=None):
+    snapshot = get_snapshot(WidgetData, pk, "bootstrap")
+    if snapshot is None:
+        stamp = get_stamps(WidgetData, [pk])[pk]
+        try:
+            widget = WidgetData.objects.with_graph().get(pk=pk)
+        except WidgetData.DoesNotExist:
+            return None
+        snapshot = publish_bootstrap(widget, request, stamp)
+    return snapshot
+
+
+def snapshot_response(
+    request, snapshot, content_type="application/json", max_age=None
+):
+    response = get_conditional_response(request, etag=snapshot["etag"])
+    if response is None:
+        response = HttpResponse(snapshot["body"], content_type=content_type)
+    response["ETag"] = snapshot["etag"]
+    if max_age is None:
+        patch_cache_control(response, public=True, max_age=PUBLIC_CACHE_MAX_AGE)
+    else:
+        patch_cache_control(response, public=True, max_age=max_age, immutable=True)
+    return response
@@ -1,37 +1,19 @@
 from celery import shared_task
-from widget.models import AppointmentWidget
-from django.core.mail import send_mail
-from widget.utils import write_sheet, create_sheet
-from django.apps import apps
+from widget.exports import write_export
+from widget.models import AppointmentWidget, ExportJob, WidgetData
+from smtplib import SMTPRecipientsRefused
 
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.utils import timezone
+from widget import sheets
 
-@shared_task
-def handle_google_sheet_integration(widget_id, model_name, values, sheet_header):
-    try:
-        model = apps.get_model(model_name)
-        widget = model.objects.get(id=widget_id)
-        sheet_id = widget.integration_google_sheets_id
-        if sheet_id:
-            write_sheet(
-                widget.user,
-                sheet_id,
-                [values],
-            )
-        else:
-            sheet_id = create_sheet(widget.user, widget.name)
-            write_sheet(
-                widget.user,
-                sheet_id,
-                [
-                    sheet_header,
-                    values,
-                ],
-            )
-            widget.integration_google_sheets_id = sheet_id
-            widget.save()
 
-    except model.DoesNotExist:
-        pass
+@shared_task
+def handle_google_sheet_integration(
+    widget_id, model_name, values=None, sheet_header=None, rows=None
+):
+    # Rows are buffered and appended in batches by widget.sheets.
+    sheets.enqueue(model_name, widget_id, sheet_header, rows or [values])
 
 
 @shared_task
@@ -43,3 +25,114 @@ def send_email_notifications(subject, body, sender, recipients_list):
         recipients_list,
         fail_silently=False,
     )
+
+
+@shared_task
+def process_submission_batch(submissions, sheets_buffered=False):
+    # Sheet rows are buffered by ingest in the transaction that stores the
+    # submissions; batches queued before that still carry them here.
+    widgets = {
+        str(widget.id): widget
+        for widget in WidgetData.objects.select_related(
+            "user", "email_notification"
+        ).filter(id__in={item["widget_id"] for item in submissions})
+    }
+    messages = []
+    sheet_rows = {}
+    for item in submissions:
+        widget = widgets.get(item["widget_id"])
+        if widget is None:
+            continue
+        field_values = item["field_values"]
+
+        if widget.user.is_oauth and not sheets_buffered:
+            rows = sheet_rows.setdefault(
+                widget.id,
+                {
+                    "sheet_header": [value["label"].lower() for value in field_values],
+                    "rows": [],
+                },
+            )
+            rows["rows"].append([value["value"] for value in field_values])
+
+        notification = widget.email_notification
+        if notification is None:
+            continue
+        email_receiver = next(
+            (value for value in field_values if value.get("type") == "email"), None
+        )
+        if email_receiver and notification.auto_responder_email:
+            messages.append(
+                (
+                    notification.response_subject,
+                    notification.response_message,
+                    widget.user.email,
+                    [email_receiver.get("value")],
+                )
+            )
+        if widget.is_email_notification:
+            user_data = "\n".join(
+                [f"{value['label']}: {value['value']}" for value in field_values]
+            )
+            messages.append(
+                (
+                    notification.subject,
+                    f"{notification.message}\n{user_data}",
+                    notification.sender_name,
+                    notification.email,
+                )
+            )
+
+    for widget_id, rows in sheet_rows.items():
+        sheets.enqueue(
+            "widget.WidgetData", widget_id, rows["sheet_header"], rows["rows"]
+        )
+    if messages:
+        send_notification_batch.delay(messages)
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=60)
+def send_notification_batch(self, messages):
+    # One SMTP connection for the batch. A refused recipient only drops its
+    # own message; on any other failure the unsent rest is retried.
+    connection = get_connection()
+    for index, (subject, body, sender, recipients) in enumerate(messages):
+        try:
+            EmailMessage(
+                subject, body, sender, recipients, connection=connection
+            ).send()
+        except SMTPRecipientsRefused:
+            continue
+        except Exception as exc:
+            connection.close()
+            raise self.retry(args=[messages[index:]], exc=exc)
+    connection.close()
+
+
+@shared_task
+def run_export_job(job_id):
+    claimed = ExportJob.objects.filter(pk=job_id, status=ExportJob.PENDING).update(
+        status=ExportJob.RUNNING
+    )
+    if not claimed:
+        return
+    job = ExportJob.objects.select_related("widget").get(pk=job_id)
+    try:
+        write_export(job)
+    except Exception as exc:
+        ExportJob.objects.filter(pk=job_id).update(
+            status=ExportJob.FAILED, error=str(exc), finished_at=timezone.now()
+        )
+        raise
+    job.status = ExportJob.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=["file", "size", "rows_written", "status", "finished_at"])
+
+    # Exports of older data are never handed out again.
+    for old in ExportJob.objects.filter(
+        widget_id=job.widget_id,
+        format=job.format,
+        status__in=[ExportJob.DONE, ExportJob.FAILED],
+        created_at__lt=job.created_at,
+    ):
+        old.delete()
@@ -1,3 +1,1267 @@
-from django.test import TestCase
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+from io import BytesIO, StringIO
+from smtplib import SMTPRecipientsRefused
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from rest_framework.test import APIClient
+
+from core.models import User
+from widget.brand import (
+    ADMIN_BRAND_INFO_CACHE_KEY,
+    ADMIN_BRAND_INFO_GENERATION_KEY,
+    get_admin_brand_info,
+    invalidate_admin_brand_info,
+)
+from widget.checks import check_shared_cache
+from widget import ingest, recaptcha, sheets
+from widget.exports import export_columns, openpyxl, parquet_stream, pyarrow
+from widget.models import (
+    AdminBrandInfo,
+    Appearance,
+    AppointmentPrice,
+    AppointmentService,
+    AppointmentWidget,
+    Container,
+    Content,
+    ExportJob,
+    FileBlob,
+    Layout,
+    PricingWidgetButtonV2,
+    PricingWidgetSettingsV2,
+    PricingWidgetV2,
+    SheetRow,
+    SubmittedData,
+    WidgetData,
+    WidgetFile,
+    WidgetRollup,
+)
+from widget.schemas import encode, get_registry, get_schema
+from widget.scripts import script_dir
+from widget.serializers import WidgetSerializer
+from widget.snapshots import get_snapshot, get_stamps, publish_snapshot
+from widget.tasks import run_export_job, send_notification_batch
+from widget.throttling import SUBMISSION_THROTTLE, bucket_key
+from widget.uploads import store_upload
+from widget.validation import compile_plan
+
+
+def widget_payload(**overrides):
+    payload = {
+        "widget_type": "FORM",
+        "name": "Contact",
+        "title": "Contact us",
+        "description": "Get in touch",
+        "html": "<div></div>",
+        "widget_fields": [
+            {"id": "1", "type": "text", "label": "Name", "required": True},
+            {"id": "2", "type": "email", "label": "Email", "required": False},
+        ],
+        "post_submit_action": WidgetData.SUCCESS_MESSAGE,
+        "success_msg": "Thanks!",
+        "default_language": "en",
+        "user_brand_info": {"name": "Brand"},
+        "display_settings": {
+            "delay": 0,
+            "scroll_percentage": 0,
+            "button_style": {"text_color": "#fff"},
+            "background": {"opacity": 1, "image_settings": {"position": "center"}},
+            "mode": {"type": "Inline"},
+            "position": {"type": "Left"},
+        },
+        "theme": {
+            "primary_color": "#000",
+            "background_color": "#fff",
+            "text_color": "#000",
+            "gradient": {"enabled": True},
+            "corner_radius": {"value": 4},
+            "dark_mode": {"gradient": {"angle": 90}},
+        },
+        "footer": {"text": "Footer"},
+        "title_style": {"bold": True},
+        "header": {"cover_image": {"enabled": False}},
+        "layout": {
+            "type": "multi",
+            "pages": [
+                {"id": "p1", "field_ids": ["1"]},
+                {"id": "p2", "field_ids": ["2"]},
+            ],
+            "navigation": {"next_button_text": "Next"},
+        },
+        "submit_button": {
+            "text": "Send",
+            "variant": "solid",
+            "size": "md",
+            "colors": {"hover": {"text": "#000000"}},
+            "spacing": {},
+        },
+        "pre_fill": [{"field_id": "1", "parameter_name": "name"}],
+        "email_notification": {"email": ["owner@example.com"]},
+    }
+    payload.update(overrides)
+    return payload
+
+
+def create_widget(user, **overrides):
+    serializer = WidgetSerializer(
+        data=widget_payload(**overrides), context={"user_id": user.id}
+    )
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+class AdminBrandInfoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidate_admin_brand_info()
+
+    def test_change_through_another_worker_is_seen(self):
+        brand = AdminBrandInfo.objects.create(name="Old", logo="brand.png")
+        self.assertEqual(get_admin_brand_info().name, "Old")
+
+        # What invalidate_admin_brand_info leaves in the shared cache when
+        # another worker saves; this worker's local copy is untouched.
+        AdminBrandInfo.objects.filter(pk=brand.pk).update(name="New")
+        cache.delete(ADMIN_BRAND_INFO_CACHE_KEY)
+        cache.set(ADMIN_BRAND_INFO_GENERATION_KEY, "other", None)
+        self.assertEqual(get_admin_brand_info().name, "New")
+
+    def test_snapshots_are_rendered_with_the_new_brand(self):
+        user = User.objects.create_user(email="owner@example.com", password="x")
+        widget = create_widget(user)
+        brand = AdminBrandInfo.objects.create(name="Old", logo="brand.png")
+        with self.captureOnCommitCallbacks(execute=True):
+            brand.save()
+        url = f"/widgets/{widget.id}"
+        self.assertEqual(
+            APIClient().get(url).json()["admin_brand_info"]["name"], "Old"
+        )
+
+        brand.name = "New"
+        with self.captureOnCommitCallbacks(execute=True):
+            brand.save()
+        self.assertEqual(
+            APIClient().get(url).json()["admin_brand_info"]["name"], "New"
+        )
+
+
+class WidgetQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidate_admin_brand_info()
+        get_admin_brand_info()
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_queries_do_not_grow_with_widget_count(self):
+        create_widget(self.user)
+        with self.assertNumQueries(3):
+            response = self.client.get("/widgets/form/")
+        self.assertEqual(len(response.json()), 1)
+
+        create_widget(self.user)
+        create_widget(self.user)
+        with self.assertNumQueries(3):
+            response = self.client.get("/widgets/form/")
+        self.assertEqual(len(response.json()), 3)
+
+    def test_detail_queries(self):
+        widget = create_widget(self.user)
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/widgets/form/{widget.id}/")
+        self.assertEqual(len(response.json()["layout"]["pages"]), 2)
+        self.assertEqual(len(response.json()["pre_fill_values"]), 1)
+
+    def test_public_read_renders_graph_in_constant_queries(self):
+        widget = create_widget(self.user)
+        client = APIClient()
+        with self.assertNumQueries(3):
+            response = client.get(f"/widgets/{widget.id}")
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            client.get(f"/widgets/{widget.id}")
+
+    def test_snapshot_rendered_before_an_edit_is_not_kept(self):
+        widget = create_widget(self.user)
+        cache.clear()
+        stamp = get_stamps(WidgetData, [widget.pk])[widget.pk]
+        stale = WidgetData.objects.with_graph().get(pk=widget.pk)
+        widget.name = "Edited"
+        widget.save()
+        publish_snapshot(stale, stamp=stamp)
+        self.assertIsNone(get_snapshot(WidgetData, widget.pk))
+
+        response = APIClient().get(f"/widgets/{widget.id}")
+        self.assertEqual(response.json()["name"], "Edited")
+        self.assertIsNotNone(get_snapshot(WidgetData, widget.pk))
+
+
+class SnapshotInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+        self.client = APIClient()
+
+    def assert_conditional(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def create_pricing(self):
+        return PricingWidgetV2.objects.create(
+            user=self.user,
+            name="Plans",
+            settings=PricingWidgetSettingsV2.objects.create(
+                multiple_tables_mode=False,
+                features_font_size=14,
+                picture_aspect_ratio=1,
+                button=PricingWidgetButtonV2.objects.create(size=2),
+            ),
+        )
+
+    def test_public_reads_answer_conditional_requests(self):
+        widget = create_widget(self.user)
+        container = Container.objects.create(
+            title="Plans",
+            user=self.user,
+            content=Content.objects.create(),
+            layout=Layout.objects.create(),
+            appearance=Appearance.objects.create(),
+        )
+        appointment = AppointmentWidget.objects.create(
+            user=self.user,
+            name="Booking",
+            service=AppointmentService.objects.create(
+                name="Cut",
+                duration=30,
+                price=AppointmentPrice.objects.create(price=10),
+            ),
+            min_advance_minutes=0,
+            max_advance_days=30,
+            trigger_button_radius=4,
+        )
+        pricing = self.create_pricing()
+        for url in (
+            f"/widgets/{widget.id}",
+            f"/widgets/pr/{container.id}",
+            f"/widgets/booking/{appointment.id}",
+            f"/widgets/v2/pricing/{pricing.pk}/",
+        ):
+            with self.subTest(url=url):
+                self.assert_conditional(url)
+
+    def test_other_id_spellings_share_the_snapshot(self):
+        pricing = self.create_pricing()
+        urls = [
+            f"/widgets/v2/pricing/{str(pricing.pk).upper()}/",
+            f"/widgets/v2/pricing/{pricing.pk.hex}/",
+        ]
+        self.assertEqual(self.client.get(urls[0]).json()["name"], "Plans")
+        for url in urls:
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).json()["name"], "Plans")
+
+        pricing.name = "Renamed"
+        pricing.save()
+        for url in urls:
+            self.assertEqual(self.client.get(url).json()["name"], "Renamed")
+        response = self.client.get("/widgets/v2/pricing/not-a-uuid/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_related_change_invalidates_snapshot(self):
+        widget = create_widget(self.user)
+        url = f"/widgets/{widget.id}"
+        etag = self.assert_conditional(url)
+
+        theme = widget.theme
+        theme.primary_color = "#123456"
+        with self.captureOnCommitCallbacks(execute=True):
+            theme.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["theme"]["primary_color"], "#123456")
+
+    def test_nested_update_invalidates_once(self):
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/widgets/form/", widget_payload(), format="json"
+            )
+        widget = WidgetData.objects.get(pk=response.json()["id"])
+
+        theme = {**widget_payload()["theme"], "text_color": "#111"}
+        payload = widget_payload(theme=theme)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                f"/widgets/form/{widget.id}/", payload, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        # One bump for the widget's own row and one for all its related rows.
+        self.assertEqual(
+            WidgetData.objects.get(pk=widget.pk).version, widget.version + 2
+        )
+        self.client.force_authenticate(None)
+        response = self.client.get(f"/widgets/{widget.id}")
+        self.assertEqual(response.json()["theme"]["text_color"], "#111")
+
+    def test_batch_returns_mixed_widgets(self):
+        widget = create_widget(self.user)
+        pricing = self.create_pricing()
+        missing = uuid.uuid4()
+        ids = f"form:{widget.id},pricing_v2:{str(pricing.pk).upper()},booking:{missing}"
+        url = f"/widgets/batch?ids={ids}"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            list(data),
+            [f"form:{widget.id}", f"pricing_v2:{pricing.pk}", f"booking:{missing}"],
+        )
+        self.assertEqual(data[f"form:{widget.id}"]["id"], str(widget.id))
+        self.assertEqual(data[f"pricing_v2:{pricing.pk}"]["name"], "Plans")
+        self.assertIsNone(data[f"booking:{missing}"])
+
+        etag = self.assert_conditional(url)
+        pricing.name = "Renamed"
+        pricing.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()[f"pricing_v2:{pricing.pk}"]["name"], "Renamed")
+
+        for ids in ("", f"chart:{widget.id}", "form:not-a-uuid"):
+            with self.subTest(ids=ids):
+                response = self.client.get(f"/widgets/batch?ids={ids}")
+                self.assertEqual(response.status_code, 400)
+
+    def test_bootstrap_is_versioned(self):
+        widget = create_widget(self.user)
+        url = f"/widgets/{widget.id}/bootstrap.js"
+        for query in ("", "?v=0"):
+            with self.subTest(query=query):
+                response = self.client.get(url + query)
+                self.assertEqual(response.status_code, 302)
+                self.assertEqual(response["Location"], f"{url}?v={widget.version}")
+
+        response = self.client.get(f"{url}?v={widget.version}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/javascript")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("max-age=31536000", response["Cache-Control"])
+        self.assertIn(str(widget.id).encode(), response.content)
+        response = self.client.get(
+            f"{url}?v={widget.version}", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+        stale = widget.version
+        widget.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            widget.save()
+        widget.refresh_from_db()
+        response = self.client.get(f"{url}?v={stale}")
+        self.assertEqual(response["Location"], f"{url}?v={widget.version}")
+        response = self.client.get(response["Location"])
+        self.assertIn(b"Renamed", response.content)
+
+
+class ScriptPublishingTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+
+    def published(self, widget):
+        directory = os.path.join(settings.MEDIA_ROOT, script_dir(widget.id))
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    def test_old_versions_are_removed(self):
+        widget = create_widget(self.user, script="console.log(1)")
+        first = widget.script_hash
+        self.assertEqual(
+            self.published(widget),
+            [f"{first}.js", f"{first}.js.br", f"{first}.js.gz"],
+        )
+
+        widget.script = "console.log(2)"
+        widget.save()
+        self.assertEqual(
+            self.published(widget),
+            [f"{widget.script_hash}.js{suffix}" for suffix in ("", ".br", ".gz")],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            widget.delete()
+        self.assertEqual(self.published(widget), [])
+
+
+class SubmissionThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+        self.widget = create_widget(self.user)
+
+    def test_burst_is_shed_and_counted(self):
+        client = APIClient()
+        url = f"/widgets/{self.widget.id}"
+        codes = [client.post(url, {}, format="json").status_code for _ in range(7)]
+        self.assertEqual(codes, [400] * 5 + [429] * 2)
+
+        output = StringIO()
+        call_command("submission_shed_stats", stdout=output)
+        self.assertIn("Shed by ip limit: 2", output.getvalue())
+
+    def test_rejected_request_spends_no_tokens(self):
+        client = APIClient()
+        url = f"/widgets/{self.widget.id}"
+        with mock.patch.dict(SUBMISSION_THROTTLE, widget_burst=2):
+            codes = [client.post(url, {}, format="json").status_code for _ in range(3)]
+        self.assertEqual(codes, [400, 400, 429])
+        tokens, _ = cache.get(bucket_key(WidgetData, self.widget.pk, "ip", "127.0.0.1"))
+        self.assertAlmostEqual(tokens, 3, delta=0.5)
+
+
+class ValidationPlanTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+
+    def test_plan_checks_required_email_and_length(self):
+        plan = compile_plan(
+            [
+                {"id": "1", "type": "text", "label": "Name", "required": True},
+                {"id": "2", "type": "email", "label": "Email"},
+                {"id": "3", "type": "text", "label": "Note", "maxLength": 3},
+            ]
+        )
+        self.assertEqual(
+            plan.validate({"2": "nope", "3": "long"}, MultiValueDict())[2],
+            {
+                "Name": "Name is required.",
+                "Email": "Email must be a valid email address.",
+                "Note": "Note must be at most 3 characters.",
+            },
+        )
+        field_values, _, errors = plan.validate({"1": " Ada "}, MultiValueDict())
+        self.assertEqual(errors, {})
+        self.assertEqual(
+            [(item["id"], item["value"]) for item in field_values],
+            [("1", "Ada"), ("2", ""), ("3", "")],
+        )
+
+    def test_legacy_fields_still_accept_submissions(self):
+        legacy = [
+            {"id": "1", "type": "text", "label": "Name", "required": "true"},
+            {"type": "text", "label": "No id"},
+            {"id": "1", "type": "text", "label": "Again"},
+            {"id": "2", "type": "email", "label": "Email", "maxLength": "long"},
+        ]
+        with self.assertRaises(ValidationError):
+            compile_plan(legacy)
+        widget = create_widget(self.user)
+        WidgetData.objects.filter(pk=widget.pk).update(widget_fields=legacy)
+
+        client = APIClient()
+        url = f"/widgets/{widget.id}"
+        response = client.post(url, {"2": "ada"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["errors"],
+            {
+                "Name": "Name is required.",
+                "Email": "Email must be a valid email address.",
+            },
+        )
+        response = client.post(
+            url, {"1": "Ada", "2": "ada@example.com"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        submission = SubmittedData.objects.get(widget=widget)
+        self.assertEqual(
+            get_registry(widget).decode(submission.schema_id, submission.data),
+            {"Name": "Ada", "Email": "ada@example.com"},
+        )
+
+
+class UploadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+        fields = widget_payload()["widget_fields"] + [
+            {
+                "id": "3",
+                "type": "file",
+                "label": "Attachment",
+                "maxFiles": 1,
+                "maxSize": 8,
+                "accept": [".txt"],
+            }
+        ]
+        self.widget = create_widget(self.user, widget_fields=fields)
+        self.client = APIClient()
+        self.url = f"/widgets/{self.widget.id}"
+
+    def upload(self, *files):
+        return self.client.post(self.url, {"1": "Ada", "3": list(files)})
+
+    def stored(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), settings.MEDIA_ROOT)
+            for root, _, names in os.walk(settings.MEDIA_ROOT)
+            for name in names
+            if "blobs" in root
+        )
+
+    def test_same_content_is_stored_once_and_counted(self):
+        for name in ("a.txt", "b.txt"):
+            response = self.upload(SimpleUploadedFile(name, b"hello"))
+            self.assertEqual(response.status_code, 200)
+        blob = FileBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(self.stored(), [blob.file.name])
+        self.assertEqual(
+            sorted(WidgetFile.objects.values_list("name", flat=True)),
+            ["a.txt", "b.txt"],
+        )
+
+        WidgetFile.objects.filter(name="a.txt").get().delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.widget.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 0)
+
+        call_command("prune_file_blobs", grace_hours=0, stdout=StringIO())
+        self.assertFalse(FileBlob.objects.exists())
+        self.assertEqual(self.stored(), [])
+
+    def test_field_limits(self):
+        cases = [
+            (
+                [SimpleUploadedFile("a.txt", b"a"), SimpleUploadedFile("b.txt", b"b")],
+                "Attachment accepts at most 1 file(s).",
+            ),
+            ([SimpleUploadedFile("a.txt", b"too large")], "must be at most 8"),
+            ([SimpleUploadedFile("a.pdf", b"%PDF")], "does not accept a.pdf"),
+        ]
+        for files, message in cases:
+            response = self.upload(*files)
+            self.assertEqual(response.status_code, 400)
+            # The text fields sent alongside the rejected file still arrive.
+            self.assertEqual(list(response.json()["errors"]), ["Attachment"])
+            self.assertIn(message, response.json()["errors"]["Attachment"])
+        self.assertFalse(WidgetFile.objects.exists())
+        self.assertEqual(self.stored(), [])
+
+    def test_stray_file_part_is_ignored(self):
+        response = self.client.post(
+            self.url, {"1": "Ada", "2": SimpleUploadedFile("a.txt", b"hello")}
+        )
+        self.assertEqual(response.status_code, 200)
+        submission = SubmittedData.objects.get(widget=self.widget)
+        self.assertEqual(
+            get_registry(self.widget).decode(submission.schema_id, submission.data),
+            {"Name": "Ada", "Email": ""},
+        )
+        self.assertFalse(WidgetFile.objects.exists())
+
+    def test_losing_copy_of_a_concurrent_upload_is_deleted(self):
+        # The other request saved its copy and committed its blob between
+        # this request's lookup and insert.
+        winner = FileBlob.objects.create(
+            sha256=hashlib.sha256(b"hello").hexdigest(),
+            file=default_storage.save("widget/blobs/winner.txt", ContentFile(b"hello")),
+            size=5,
+        )
+        get = FileBlob.objects.get
+        lookups = []
+
+        def race(**kwargs):
+            lookups.append(kwargs)
+            if len(lookups) == 1:
+                raise FileBlob.DoesNotExist
+            return get(**kwargs)
+
+        with mock.patch.object(FileBlob.objects, "get", side_effect=race):
+            upload = store_upload(
+                self.widget, "3", SimpleUploadedFile("b.txt", b"hello")
+            )
+        self.assertEqual(upload.blob_id, winner.pk)
+        self.assertEqual(upload.file.name, "widget/blobs/winner.txt")
+        self.assertEqual(self.stored(), ["widget/blobs/winner.txt"])
+        self.assertEqual(FileBlob.objects.get().ref_count, 1)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+        self.widget = create_widget(self.user)
+        self.url = f"/widgets/{self.widget.id}"
+
+    def post(self, data, key="retry-1"):
+        return APIClient().post(
+            self.url, data, format="json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_success_is_replayed_once_stored(self):
+        first = self.post({"1": "Ada"})
+        self.assertEqual(first.status_code, 200)
+        replay = self.post({"1": "Ada"})
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(SubmittedData.objects.filter(widget=self.widget).count(), 1)
+
+    def test_rejected_request_can_be_corrected_under_same_key(self):
+        self.assertEqual(self.post({}).status_code, 400)
+        response = self.post({"1": "Ada"})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+
+    def test_request_in_flight_gets_409(self):
+        digest = hashlib.sha256(b"retry-1").hexdigest()
+        cache.add(f"widget:idempotency:form:{self.widget.id}:{digest}:lock", 1)
+        self.assertEqual(self.post({"1": "Ada"}).status_code, 409)
+        self.assertFalse(SubmittedData.objects.filter(widget=self.widget).exists())
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_deploy_check_requires_shared_cache(self):
+        self.assertEqual(
+            [error.id for error in check_shared_cache(None)], ["widget.E001"]
+        )
+
+
+class RecaptchaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+        self.widget = create_widget(self.user)
+        WidgetData.objects.filter(pk=self.widget.pk).update(spam_protection=True)
+        self.client = APIClient()
+        self.url = f"/widgets/{self.widget.id}"
+
+    def submit(self, token, key=None, **values):
+        headers = {"HTTP_IDEMPOTENCY_KEY": key} if key else {}
+        return self.client.post(
+            self.url, {"recaptchaToken": token, **values}, format="json", **headers
+        )
+
+    @mock.patch.object(recaptcha.RecaptchaVerifier, "_request")
+    def test_token_is_only_reused_by_the_same_submission(self, verify):
+        # Google accepts each token once and reports reuse as a failure.
+        verify.side_effect = [True, False, True, False]
+        self.assertEqual(self.submit("a", **{"1": "Ada"}).status_code, 200)
+        response = self.submit("a", **{"1": "Ada"})
+        self.assertEqual(response.json(), {"error": "Invalid reCAPTCHA token"})
+
+        # Corrected and retried under its Idempotency-Key, a submission keeps
+        # its verified token; another submission cannot borrow it.
+        self.assertIn("Name", self.submit("b", key="k1").json()["errors"])
+        self.assertEqual(self.submit("b", key="k1", **{"1": "Ada"}).status_code, 200)
+        response = self.submit("b", key="k2", **{"1": "Bob"})
+        self.assertEqual(response.json(), {"error": "Invalid reCAPTCHA token"})
+        self.assertEqual(verify.call_count, 4)
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="owner@example.com", password="x", is_oauth=True
+        )
+        self.widget = create_widget(self.user)
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.spool_dir = spool.name
+        patcher = mock.patch.object(ingest, "INGEST_DIR", self.spool_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enqueue(self, name):
+        ingest.enqueue(
+            self.widget, [{"id": "1", "label": "Name", "type": "text", "value": name}]
+        )
+
+    def assert_persisted(self):
+        count = 2
+        self.widget.refresh_from_db()
+        self.assertEqual(self.widget.total_submissions, count)
+        self.assertEqual(
+            SubmittedData.objects.filter(widget=self.widget).count(), count
+        )
+        self.assertEqual(
+            WidgetRollup.objects.get(
+                widget_id=self.widget.id, period=WidgetRollup.DAY
+            ).submissions,
+            count,
+        )
+        self.assertEqual(
+            list(
+                SheetRow.objects.filter(widget_id=self.widget.id).values_list(
+                    "values", flat=True
+                )
+            ),
+            [["Ada"], ["Grace"]],
+        )
+
+    def test_spool_is_flushed_and_replayed_once(self):
+        self.enqueue("Ada")
+        self.enqueue("Grace")
+        with open(os.path.join(self.spool_dir, ingest.SPOOL_NAME), "rb") as spool:
+            spooled = spool.read()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(ingest.flush(), 2)
+        self.assertTrue(callbacks)
+        self.assert_persisted()
+        self.assertEqual(
+            [
+                get_registry(self.widget).decode(schema_id, data)
+                for schema_id, data in SubmittedData.objects.order_by("id").values_list(
+                    "schema_id", "data"
+                )
+            ],
+            [{"Name": "Ada"}, {"Name": "Grace"}],
+        )
+
+        # A spool file left behind by a flush that died before removing it.
+        path = os.path.join(self.spool_dir, "submissions.1.flushing")
+        with open(path, "wb") as spool:
+            spool.write(spooled)
+        self.assertEqual(ingest.flush(), 0)
+        self.assertFalse(os.path.exists(path))
+        self.assert_persisted()
+
+    def test_records_spooled_before_schemas_keep_their_keys(self):
+        record = {
+            "key": str(uuid.uuid4()),
+            "widget_id": str(self.widget.id),
+            "field_values": [{"label": "Phone", "type": "text", "value": "1"}],
+        }
+        with open(os.path.join(self.spool_dir, ingest.SPOOL_NAME), "w") as spool:
+            spool.write(json.dumps(record) + "\n")
+        self.assertEqual(ingest.flush(), 1)
+        self.assertEqual(
+            list(self.widget.legacy_keys.values_list("key", flat=True)), ["Phone"]
+        )
+
+    def test_flush_is_skipped_while_another_runs(self):
+        self.enqueue("Ada")
+        self.enqueue("Grace")
+        lock = ingest._lock(fcntl.LOCK_EX, ingest.FLUSH_LOCK_NAME)
+        try:
+            self.assertEqual(ingest.flush(), 0)
+        finally:
+            ingest._unlock(lock)
+        self.assertFalse(SubmittedData.objects.exists())
+        self.assertEqual(ingest.flush(), 2)
+        self.assert_persisted()
+
+    def test_refused_recipient_does_not_drop_the_batch(self):
+        messages = [
+            ("Hi", "body", "owner@example.com", [f"{name}@example.com"])
+            for name in ("ada", "bad", "grace")
+        ]
+        refused = SMTPRecipientsRefused({"bad@example.com": (550, b"no")})
+        send = mock.Mock(side_effect=[1, refused, 1])
+        with mock.patch("widget.tasks.EmailMessage.send", send):
+            send_notification_batch(messages)
+        self.assertEqual(send.call_count, 3)
+
+
+class SubmissionListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.widget = create_widget(self.user)
+
+    def submit(self, **values):
+        schema = get_schema(self.widget)
+        field_values = [{"id": key, "value": value} for key, value in values.items()]
+        return SubmittedData.objects.create(
+            widget=self.widget, schema=schema, data=encode(schema, field_values)
+        )
+
+    def test_pages_walk_all_rows_in_constant_queries(self):
+        for i in range(7):
+            self.submit(**{"1": f"n{i}"})
+
+        ids = []
+        url = f"/widgets/form/{self.widget.id}/data/?page_size=3"
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            ids += [row["id"] for row in response.json()["results"]]
+            url = response.json()["next"]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(ids), 7)
+
+    def test_filters_and_sparse_fields(self):
+        self.submit(**{"1": "a", "2": "a@example.com"})
+        self.submit(**{"1": "b", "2": "b@example.com"})
+
+        response = self.client.get(
+            f"/widgets/form/{self.widget.id}/data/?data.Name=b&fields=data.Email"
+        )
+        self.assertEqual(
+            response.json()["results"], [{"data": {"Email": "b@example.com"}}]
+        )
+
+    def test_search_scans_without_a_full_text_index(self):
+        match = self.submit(**{"1": "Ada Lovelace"})
+        self.submit(**{"1": "Grace Hopper"})
+        url = f"/widgets/form/{self.widget.id}/data/"
+        with mock.patch("widget.search.connection", SimpleNamespace(vendor="mysql")):
+            response = self.client.get(url, {"search": "lovelace ADA"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["id"] for row in response.json()["results"]], [match.id])
+
+    def test_invalid_dates_are_rejected(self):
+        url = f"/widgets/form/{self.widget.id}/data/"
+        for value in ("2024-13-01", "2024-02-30T10:00", "yesterday"):
+            response = self.client.get(url, {"created_after": value})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("created_after", response.json())
+
+    def test_search_ranks_matching_submissions(self):
+        first = self.submit(**{"1": "Ada Lovelace", "2": "ada@example.com"})
+        self.submit(**{"1": "Grace Hopper", "2": "grace@example.com"})
+        best = self.submit(**{"1": "Ada", "2": "ada@lovelace.dev"})
+        SubmittedData.objects.create(widget=self.widget, data={"Name": "Ada Byron"})
+        other = create_widget(self.user)
+        SubmittedData.objects.create(widget=other, data={"Name": "Ada Lovelace"})
+
+        url = f"/widgets/form/{self.widget.id}/data/?search=ada&page_size=2"
+        response = self.client.get(url)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 2)
+        self.assertGreaterEqual(results[0]["rank"], results[1]["rank"])
+        rest = self.client.get(response.json()["next"]).json()["results"]
+        self.assertEqual(len(rest), 1)
+
+        response = self.client.get(
+            f"/widgets/form/{self.widget.id}/data/?search=ada lovelace"
+        )
+        self.assertEqual(
+            sorted(row["id"] for row in response.json()["results"]),
+            [first.id, best.id],
+        )
+
+    def test_csv_export_streams_all_schema_versions(self):
+        SubmittedData.objects.create(widget=self.widget, data={"Phone": "123"})
+        self.submit(**{"1": "Ada", "2": "ada@example.com"})
+
+        url = f"/widgets/{self.widget.id}/download-data"
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            b"".join(response.streaming_content).decode().splitlines(),
+            ["Name,Email,Phone", ",,123", "Ada,ada@example.com,"],
+        )
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        content = gzip.decompress(b"".join(response.streaming_content))
+        self.assertTrue(content.startswith(b"Name,Email,Phone\r\n"))
+
+        response = self.client.get(url, {"format": "ndjson"})
+        content = b"".join(response.streaming_content)
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [row["data"] for row in rows],
+            [{"Phone": "123"}, {"Name": "Ada", "Email": "ada@example.com"}],
+        )
+
+    def test_legacy_columns_come_from_stored_keys(self):
+        SubmittedData.objects.create(widget=self.widget, data={"Phone": "1"})
+        SubmittedData.objects.create(widget=self.widget, data={"Name": "x", "Fax": "2"})
+        self.submit(**{"1": "Ada"})
+        registry = get_registry(self.widget)
+
+        with self.assertNumQueries(1):
+            columns = export_columns(self.widget, registry)
+        self.assertEqual(columns, ["Name", "Email", "Fax", "Phone"])
+
+    @mock.patch("widget.exports.EXPORT_SETTLE_SECONDS", 0)
+    def test_delta_export_returns_rows_after_cursor(self):
+        first = self.submit(**{"1": "Ada"})
+        url = f"/widgets/{self.widget.id}/download-data"
+
+        response = self.client.get(url, {"since": 0, "format": "ndjson"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(response["Export-Cursor"], str(first.id))
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])["data"], {"Name": "Ada"})
+
+        second = self.submit(**{"1": "Bob", "2": "bob@example.com"})
+        third = self.submit(**{"1": "Cy"})
+        response = self.client.get(
+            url, {"since": first.id, "limit": 1}, HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response["Export-Cursor"], str(second.id))
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0], "id,created_at,Name,Email")
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(rows[1].startswith(f"{second.id},"))
+
+        response = self.client.get(url, {"since": third.id})
+        self.assertEqual(response["Export-Cursor"], str(third.id))
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 1)
+        self.assertEqual(self.client.get(url, {"since": "x"}).status_code, 400)
+
+    def test_delta_export_cursor_stops_before_recent_rows(self):
+        settled = self.submit(**{"1": "Ada"})
+        SubmittedData.objects.filter(pk=settled.pk).update(
+            created_at=timezone.now() - timedelta(minutes=5)
+        )
+        recent = self.submit(**{"1": "Bob"})
+        url = f"/widgets/{self.widget.id}/download-data"
+
+        response = self.client.get(url, {"since": 0, "format": "ndjson"})
+        self.assertEqual(response["Export-Cursor"], str(settled.id))
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 1)
+
+        response = self.client.get(url, {"since": settled.id, "format": "ndjson"})
+        self.assertEqual(response["Export-Cursor"], str(settled.id))
+        self.assertEqual(b"".join(response.streaming_content), b"")
+
+        SubmittedData.objects.filter(pk=recent.pk).update(
+            created_at=timezone.now() - timedelta(minutes=1)
+        )
+        response = self.client.get(url, {"since": settled.id, "format": "ndjson"})
+        self.assertEqual(response["Export-Cursor"], str(recent.id))
+
+    def test_relabelled_fields_keep_older_submissions(self):
+        SubmittedData.objects.create(widget=self.widget, data={"Name": "legacy"})
+        self.submit(**{"1": "old"})
+        fields = [dict(field) for field in self.widget.widget_fields]
+        fields[0]["label"] = "Full name"
+        self.widget.widget_fields = fields
+        self.widget.save()
+        self.submit(**{"1": "new"})
+
+        response = self.client.get(
+            f"/widgets/form/{self.widget.id}/data/?data.Full name__startswith=o"
+        )
+        self.assertEqual(
+            [row["data"] for row in response.json()["results"]],
+            [{"Full name": "old"}],
+        )
+        response = self.client.get(
+            f"/widgets/form/{self.widget.id}/data/?data.Name=legacy"
+        )
+        self.assertEqual(len(response.json()["results"]), 1)
+
+
+class WidgetStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.widget = create_widget(self.user)
+
+    def test_reconcile_repairs_drifted_counts(self):
+        for name in ("Ada", "Grace"):
+            SubmittedData.objects.create(widget=self.widget, data={"Name": name})
+        idle = create_widget(self.user)
+        WidgetData.objects.filter(pk=self.widget.pk).update(total_submissions=7)
+        WidgetData.objects.filter(pk=idle.pk).update(total_submissions=3)
+
+        output = StringIO()
+        call_command("reconcile_submission_counts", dry_run=True, stdout=output)
+        self.assertIn("Found 2 drifted widget(s).", output.getvalue())
+        self.widget.refresh_from_db()
+        self.assertEqual(self.widget.total_submissions, 7)
+
+        output = StringIO()
+        call_command("reconcile_submission_counts", stdout=output)
+        self.assertIn(f"{self.widget.pk}: 7 -> 2", output.getvalue())
+        self.assertIn(f"{idle.pk}: 3 -> 0", output.getvalue())
+        self.assertEqual(
+            dict(
+                WidgetData.objects.filter(pk__in=[self.widget.pk, idle.pk]).values_list(
+                    "pk", "total_submissions"
+                )
+            ),
+            {self.widget.pk: 2, idle.pk: 0},
+        )
+        output = StringIO()
+        call_command("reconcile_submission_counts", stdout=output)
+        self.assertIn("Repaired 0 drifted widget(s).", output.getvalue())
+
+    def test_stats_read_incremental_rollups(self):
+        now = timezone.now()
+        for days_ago in (0, 0, 2):
+            SubmittedData.objects.create(
+                widget=self.widget,
+                data={"Name": "x"},
+                created_at=now - timedelta(days=days_ago),
+            )
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/widgets/form/{self.widget.id}/stats/")
+        body = response.json()
+        self.assertEqual(len(body["series"]["start"]), 30)
+        self.assertEqual(body["series"]["submissions"][-3:], [1, 0, 2])
+        self.assertEqual(body["totals"], {"submissions": 3, "bookings": 0, "files": 0})
+
+        response = self.client.get(
+            f"/widgets/form/{self.widget.id}/stats/?period=hour&since=2000-01-01"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_backfill_matches_incremental_counts(self):
+        for _ in range(3):
+            SubmittedData.objects.create(widget=self.widget, data={"Name": "x"})
+        incremental = list(
+            WidgetRollup.objects.values_list("period", "start", "submissions")
+        )
+        WidgetRollup.objects.all().delete()
+
+        call_command("backfill_rollups", stdout=StringIO())
+        self.assertCountEqual(
+            WidgetRollup.objects.values_list("period", "start", "submissions"),
+            incremental,
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ExportJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.widget = create_widget(self.user)
+        self.url = f"/widgets/form/{self.widget.id}/exports/"
+        for name in ("Ada", "Grace"):
+            SubmittedData.objects.create(widget=self.widget, data={"Name": name})
+
+    def export(self, export_format="csv"):
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.post(
+                self.url, {"format": export_format}, format="json"
+            )
+        if response.status_code == 201:
+            run_export_job(response.json()["id"])
+        return self.client.get(f"{self.url}{response.json()['id']}/").json()
+
+    def test_export_is_reused_until_data_changes(self):
+        job = self.export()
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["rows_written"], 2)
+        self.assertEqual(self.export()["id"], job["id"])
+
+        SubmittedData.objects.create(widget=self.widget, data={"Name": "Alan"})
+        newer = self.export()
+        self.assertNotEqual(newer["id"], job["id"])
+        self.assertEqual(newer["rows_written"], 3)
+        self.assertFalse(ExportJob.objects.filter(pk=job["id"]).exists())
+
+    def test_stale_job_is_replaced(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            stuck = self.client.post(self.url, {"format": "csv"}, format="json").json()
+        self.assertEqual(self.export()["id"], stuck["id"])
+
+        ExportJob.objects.filter(pk=stuck["id"]).update(
+            status=ExportJob.RUNNING, created_at=timezone.now() - timedelta(hours=2)
+        )
+        job = self.export()
+        self.assertNotEqual(job["id"], stuck["id"])
+        self.assertEqual(job["status"], "done")
+        # Failed once it timed out, then cleared out by the newer export.
+        self.assertFalse(ExportJob.objects.filter(pk=stuck["id"]).exists())
+        run_export_job(stuck["id"])
+        self.assertEqual(ExportJob.objects.get(pk=job["id"]).status, ExportJob.DONE)
+
+    def test_download_resumes_with_range(self):
+        job = self.export()
+        response = self.client.get(job["download_url"])
+        content = b"".join(response.streaming_content)
+        self.assertEqual(content, b"Name\r\nAda\r\nGrace\r\n")
+
+        response = self.client.get(
+            job["download_url"], HTTP_RANGE="bytes=6-", HTTP_IF_RANGE=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response["Content-Range"], f"bytes 6-{len(content) - 1}/{len(content)}"
+        )
+        self.assertEqual(b"".join(response.streaming_content), content[6:])
+
+        response = self.client.get(job["download_url"], HTTP_RANGE="bytes=999-")
+        self.assertEqual(response.status_code, 416)
+
+    @skipUnless(openpyxl and pyarrow, "XLSX and Parquet exports are optional")
+    def test_columnar_formats(self):
+        job = self.export("xlsx")
+        response = self.client.get(job["download_url"])
+        workbook = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(
+            [[cell.value for cell in row] for row in workbook.active.iter_rows()],
+            [["Name"], ["Ada"], ["Grace"]],
+        )
+
+        job = self.export("parquet")
+        response = self.client.get(job["download_url"])
+        self.assertEqual(response["Content-Type"], "application/vnd.apache.parquet")
+        content = b"".join(response.streaming_content)
+        table = pyarrow.parquet.read_table(BytesIO(content))
+        self.assertEqual(table.column("Name").to_pylist(), ["Ada", "Grace"])
+        self.assertEqual(table.schema.field("id").type, pyarrow.int64())
+
+    @skipUnless(pyarrow, "Parquet exports are optional")
+    def test_parquet_names_are_unique_strings(self):
+        created = timezone.now().isoformat()
+        content = b"".join(
+            parquet_stream(
+                [None, "id", "created_at", "Name", "Name"],
+                [[1, created, "a", "b", "c", "d", "e"]],
+                meta=True,
+            )
+        )
+        table = pyarrow.parquet.read_table(BytesIO(content))
+        self.assertEqual(
+            table.column_names,
+            ["id", "created_at", "column1", "id_2", "created_at_2", "Name", "Name_2"],
+        )
+        self.assertEqual(table.to_pylist()[0]["id_2"], "b")
+
+
+    def test_invalid_dates_are_rejected(self):
+        response = self.client.get(
+            f"/widgets/form/{self.widget.id}/stats/", {"since": "2024-02-30"}
+        )
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaisesMessage(CommandError, "--since"):
+            call_command("backfill_rollups", since="2024-02-30", stdout=StringIO())
+
+
+class SheetSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="owner@example.com", password="x")
+        self.widget = create_widget(self.user)
+
+    def enqueue(self, *rows):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            sheets.enqueue("widget.WidgetData", self.widget.id, ["name"], rows)
+        return callbacks
+
+    @mock.patch("widget.sheets.create_sheet", return_value="sheet-1")
+    @mock.patch("widget.sheets.write_sheet")
+    @mock.patch("widget.sheets.flush_sheet_rows")
+    def test_rows_are_appended_in_batches(self, task, write_sheet, create_sheet):
+        self.assertEqual(len(self.enqueue(["Ada"])), 1)
+        self.assertEqual(len(self.enqueue(["Grace"], ["Alan"])), 0)
+        task.apply_async.assert_called_once()
+        self.assertEqual(sheets.lag(self.widget.id)["pending_rows"], 3)
+
+        self.assertEqual(sheets.flush("widget.WidgetData", self.widget.id), 3)
+        create_sheet.assert_called_once()
+        write_sheet.assert_called_once_with(
+            self.user, "sheet-1", [["name"], ["Ada"], ["Grace"], ["Alan"]]
+        )
+
+        write_sheet.side_effect = OSError("quota")
+        self.enqueue(["Edsger"])
+        with self.assertRaises(OSError):
+            sheets.flush("widget.WidgetData", self.widget.id)
+        self.assertEqual(sheets.lag(self.widget.id)["pending_rows"], 1)
+
+        write_sheet.side_effect = None
+        self.assertEqual(sheets.flush("widget.WidgetData", self.widget.id), 1)
+        write_sheet.assert_called_with(self.user, "sheet-1", [["Edsger"]])
+        self.assertEqual(
+            sheets.lag(self.widget.id), {"pending_rows": 0, "lag_seconds": 0}
+        )
+
+    @mock.patch("widget.sheets.create_sheet", return_value="sheet-1")
+    @mock.patch("widget.sheets.write_sheet")
+    @mock.patch("widget.sheets.flush_sheet_rows")
+    def test_new_sheet_does_not_overwrite_owner_edits(
+        self, task, write_sheet, create_sheet
+    ):
+        self.enqueue(["Ada"])
+        version = WidgetData.objects.get(pk=self.widget.pk).version
+
+        def owner_edits(*args):
+            WidgetData.objects.filter(pk=self.widget.pk).update(name="Renamed")
+
+        write_sheet.side_effect = owner_edits
+        self.assertEqual(sheets.flush("widget.WidgetData", self.widget.id), 1)
+        widget = WidgetData.objects.get(pk=self.widget.pk)
+        self.assertEqual(widget.name, "Renamed")
+        self.assertEqual(widget.integration_google_sheets_id, "sheet-1")
+        self.assertEqual(widget.version, version)
+
+        write_sheet.side_effect = None
+        self.enqueue(["Grace"])
+        sheets.flush("widget.WidgetData", self.widget.id)
+        create_sheet.assert_called_once()
+        write_sheet.assert_called_with(self.user, "sheet-1", [["Grace"]])
+
+    @mock.patch("widget.sheets.create_sheet", return_value="sheet-1")
+    @mock.patch("widget.sheets.write_sheet")
+    @mock.patch("widget.sheets.flush_sheet_rows")
+    def test_append_runs_outside_a_transaction_under_a_lease(
+        self, task, write_sheet, create_sheet
+    ):
+        self.enqueue(["Ada"], ["Grace"])
+        depth = len(connection.atomic_blocks)
+        seen = []
+
+        def append(*args):
+            seen.append(len(connection.atomic_blocks))
+            # A second flusher leaves the leased batch alone.
+            seen.append(sheets.flush("widget.WidgetData", self.widget.id))
+
+        write_sheet.side_effect = append
+        self.assertEqual(sheets.flush("widget.WidgetData", self.widget.id), 2)
+        self.assertEqual(seen, [depth, 0])
+        write_sheet.assert_called_once()
+        self.assertFalse(SheetRow.objects.exists())
+
+        self.enqueue(["Alan"])
+        SheetRow.objects.update(
+            claimed_by=uuid.uuid4(),
+            claimed_until=timezone.now() - timedelta(seconds=1),
+        )
+        write_sheet.side_effect = None
+        self.assertEqual(sheets.flush("widget.WidgetData", self.widget.id), 1)
+        write_sheet.assert_called_with(self.user, "sheet-1", [["Alan"]])
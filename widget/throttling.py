@@ -0,0 +1,182 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.throttling import BaseThrottle
+
+
+# Rates are per minute; a bucket holds up to ``burst`` tokens.
+SUBMISSION_THROTTLE = {
+    "widget_rate": 120,
+    "widget_burst": 60,
+    "ip_rate": 10,
+    "ip_burst": 5,
+    **getattr(settings, "WIDGET_SUBMISSION_THROTTLE", {}),
+}
+LIMITS_CACHE_TIMEOUT = getattr(settings, "WIDGET_THROTTLE_LIMITS_CACHE_TIMEOUT", 60)
+SHED_METRICS_TIMEOUT = getattr(settings, "WIDGET_SHED_METRICS_TIMEOUT", 60 * 60 * 48)
+LIMIT_FIELDS = ["widget_rate", "widget_burst", "ip_rate", "ip_burst"]
+
+_MISSING = "missing"
+
+# Refills every bucket in KEYS and takes a token from each, or from none if
+# one is empty. ARGV is now, then rate, burst per key, then the TTL. Returns
+# the 1-based index of the empty bucket (0 if none) and the seconds it needs.
+TAKE_TOKENS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local levels = {}
+for i, key in ipairs(KEYS) do
+    local per_second = tonumber(ARGV[2 * i]) / 60
+    local burst = tonumber(ARGV[2 * i + 1])
+    local state = redis.call("HMGET", key, "tokens", "updated")
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * per_second)
+    if tokens < 1 then
+        return {i, tostring((1 - tokens) / per_second)}
+    end
+    levels[i] = tokens - 1
+end
+local ttl = tonumber(ARGV[2 * #KEYS + 2])
+for i, key in ipairs(KEYS) do
+    redis.call("HSET", key, "tokens", tostring(levels[i]), "updated", ARGV[1])
+    redis.call("EXPIRE", key, ttl)
+end
+return {0, "0"}
+"""
+
+
+def limits_key(model, pk):
+    return f"widget:throttle:limits:{model._meta.label_lower}:{pk}"
+
+
+def bucket_key(model, pk, scope, ident=""):
+    return f"widget:throttle:bucket:{model._meta.label_lower}:{pk}:{scope}:{ident}"
+
+
+def shed_key(hour, name):
+    return f"widget:shed:{hour}:{name}"
+
+
+def shed_hour(timestamp=None):
+    return time.strftime("%Y%m%d%H", time.gmtime(timestamp))
+
+
+def load_limits(model, pk):
+    row = (
+        model.objects.filter(pk=pk)
+        .values(*[f"user__submission_rate_limit__{field}" for field in LIMIT_FIELDS])
+        .first()
+    )
+    if row is None:
+        return _MISSING
+    return {
+        field: row[f"user__submission_rate_limit__{field}"]
+        or SUBMISSION_THROTTLE[field]
+        for field in LIMIT_FIELDS
+    }
+
+
+def take_token(state, rate, burst, now):
+    # Returns the bucket's new state, or the seconds until a token is free.
+    per_second = rate / 60
+    tokens, updated = state if state else (burst, now)
+    tokens = min(burst, tokens + (now - updated) * per_second)
+    if tokens < 1:
+        return None, (1 - tokens) / per_second
+    return (tokens - 1, now), 0
+
+
+def take_tokens(buckets, now, timeout):
+    # Takes a token from every (key, rate, burst) bucket, or from none of
+    # them. Returns the index of the first empty bucket and the seconds until
+    # it refills, or (None, 0). On Redis this is one atomic script; other
+    # caches, used in tests and development, check and write separately.
+    backend = caches["default"]
+    if isinstance(backend, RedisCache):
+        client = backend._cache.get_client(write=True)
+        args = [now]
+        for _, rate, burst in buckets:
+            args += [rate, burst]
+        index, wait = client.register_script(TAKE_TOKENS_SCRIPT)(
+            keys=[backend.make_and_validate_key(key) for key, _, _ in buckets],
+            args=[*args, timeout],
+        )
+        return (int(index) - 1 if int(index) else None), float(wait)
+
+    states = backend.get_many([key for key, _, _ in buckets])
+    updates = {}
+    for index, (key, rate, burst) in enumerate(buckets):
+        state, wait = take_token(states.get(key), rate, burst, now)
+        if state is None:
+            return index, wait
+        updates[key] = state
+    backend.set_many(updates, timeout)
+    return None, 0
+
+
+def record_shed(model, pk, scope):
+    hour = shed_hour()
+    for name in (scope, f"{model._meta.label_lower}:{pk}:{scope}"):
+        key = shed_key(hour, name)
+        cache.add(key, 0, SHED_METRICS_TIMEOUT)
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass
+
+
+def shed_counts(hours=24, names=("widget", "ip")):
+    now = time.time()
+    keys = {
+        shed_key(shed_hour(now - offset * 3600), name): (
+            shed_hour(now - offset * 3600),
+            name,
+        )
+        for offset in range(hours)
+        for name in names
+    }
+    return {keys[key]: count for key, count in cache.get_many(keys).items()}
+
+
+class SubmissionThrottle(BaseThrottle):
+    # Token buckets per widget and per client IP, checked before the view
+    # does any work. Buckets and shed counts live in the shared cache, so the
+    # limits hold across workers and submission_shed_stats can read them. A
+    # request only spends tokens if every bucket lets it through.
+    def allow_request(self, request, view):
+        if request.method != "POST":
+            return True
+        model = view.submission_model
+        pk = view.kwargs["uuid"]
+        limits = cache.get(limits_key(model, pk))
+        if limits is None:
+            limits = load_limits(model, pk)
+            cache.set(limits_key(model, pk), limits, LIMITS_CACHE_TIMEOUT)
+        if limits == _MISSING:
+            # The view answers with a 404.
+            return True
+
+        scopes = {"ip": self.get_ident(request), "widget": ""}
+        buckets = [
+            (
+                bucket_key(model, pk, scope, ident),
+                limits[f"{scope}_rate"],
+                limits[f"{scope}_burst"],
+            )
+            for scope, ident in scopes.items()
+        ]
+        # A full bucket is the same as a missing one, so state only needs to
+        # outlive the time it takes to refill.
+        refill = max(60 * burst / rate for _, rate, burst in buckets)
+        index, wait = take_tokens(buckets, time.time(), math.ceil(refill) + 1)
+        if index is None:
+            return True
+        self.wait_seconds = wait
+        record_shed(model, pk, list(scopes)[index])
+        return False
+
+    def wait(self):
+        return getattr(self, "wait_seconds", None)
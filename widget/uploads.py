@@ -0,0 +1,139 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import IntegrityError, transaction
+from django.template.defaultfilters import filesizeformat
+
+from widget.models import FileBlob, WidgetFile
+
+
+class HashedUploadedFile(TemporaryUploadedFile):
+    sha256 = None
+
+
+class SkippedFile:
+    # Stands in for a rejected file: the parser closes the handler's file
+    # when SkipFile is raised and drops the whole form if that fails.
+    def close(self):
+        pass
+
+
+SKIPPED = SkippedFile()
+
+
+class HashingUploadHandler(FileUploadHandler):
+    # Streams each file part to a temporary file while hashing it and applies
+    # the widget's per-field limits as the bytes arrive. Rejected files are
+    # skipped and reported in ``errors`` keyed by field label.
+    chunk_size = 64 * 2**10
+
+    def __init__(self, plan, request=None):
+        super().__init__(request)
+        self.plan = plan
+        self.errors = {}
+        self.counts = {}
+        self.limits = None
+        self.file = SKIPPED
+
+    def new_file(
+        self, field_name, file_name, content_type, content_length, *args, **kwargs
+    ):
+        super().new_file(
+            field_name, file_name, content_type, content_length, *args, **kwargs
+        )
+        self.file = SKIPPED
+        self.limits = self.plan.file_limits.get(field_name)
+        if self.limits is None:
+            raise SkipFile()
+
+        label = self.limits.label
+        if self.counts.get(field_name, 0) >= self.limits.max_files:
+            self._reject(f"{label} accepts at most {self.limits.max_files} file(s).")
+        if not self.limits.accepts(file_name, content_type):
+            self._reject(f"{label} does not accept {file_name}.")
+        if content_length is not None and content_length > self.limits.max_size:
+            self._reject_size()
+
+        self.counts[field_name] = self.counts.get(field_name, 0) + 1
+        self.hasher = hashlib.sha256()
+        self.file = HashedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.limits.max_size:
+            self.file.close()
+            self.file = SKIPPED
+            self.counts[self.field_name] -= 1
+            self._reject_size()
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.file is SKIPPED:
+            return None
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        self.file.close()
+
+    def _reject(self, message):
+        self.errors[self.limits.label] = message
+        raise SkipFile()
+
+    def _reject_size(self):
+        self._reject(
+            f"{self.limits.label} files must be at most "
+            f"{filesizeformat(self.limits.max_size)}."
+        )
+
+
+def _get_blob(upload):
+    try:
+        return FileBlob.objects.get(sha256=upload.sha256)
+    except FileBlob.DoesNotExist:
+        pass
+
+    blob = FileBlob(
+        sha256=upload.sha256,
+        size=upload.size,
+        content_type=upload.content_type or "",
+    )
+    path = blob.file.field.generate_filename(blob, upload.name)
+    saved = not default_storage.exists(path)
+    blob.file.name = default_storage.save(path, upload) if saved else path
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # Another request stored the same content first. If both wrote the
+        # file, storage gave this copy another name and nothing refers to it.
+        winner = FileBlob.objects.get(sha256=upload.sha256)
+        if saved and blob.file.name != winner.file.name:
+            default_storage.delete(blob.file.name)
+        return winner
+    return blob
+
+
+def store_upload(widget, field_id, upload):
+    if getattr(upload, "sha256", None) is None:
+        # Not streamed through HashingUploadHandler.
+        hasher = hashlib.sha256()
+        for chunk in upload.chunks():
+            hasher.update(chunk)
+        upload.sha256 = hasher.hexdigest()
+        upload.seek(0)
+    blob = _get_blob(upload)
+    return WidgetFile.objects.create(
+        widget=widget,
+        file=blob.file.name,
+        blob=blob,
+        field_id=field_id,
+        name=os.path.basename(upload.name)[:255],
+    )
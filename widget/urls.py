@@ -1,6 +1,6 @@
-from django.urls import path
+from django.urls import path, re_path
 from rest_framework_nested.routers import DefaultRouter, NestedDefaultRouter
-from . import views
+from . import public_views, views
 
 router = DefaultRouter()
 router.register("form", views.WidgetViewSet, basename="FormWidget")
@@ -12,14 +12,45 @@ router.register(
 router.register("image", views.ImageUploadViewSet)
 router.register("v2/pricing", views.PricingWidgetViewSetV2, basename="Pricing Widget")
 widget_data = NestedDefaultRouter(router, "form", lookup="widget")
-# widget_data.register("data", views.SubmittedDataView, basename="Submitted Data")
+widget_data.register("data", views.SubmittedDataView, basename="Submitted Data")
+widget_data.register("exports", views.ExportJobViewSet, basename="export-job")
 
 
 urlpatterns = [
-    path("<uuid:uuid>", views.WidgetCodeView.as_view()),
-    path("booking/<uuid:uuid>", views.AppointmentViewSet.as_view()),
+    path("batch", views.WidgetBatchView.as_view()),
+    path("<uuid:uuid>", public_views.widget_config(views.WidgetCodeView.as_view())),
+    path(
+        "<uuid:uuid>/bootstrap.js",
+        views.WidgetBootstrapView.as_view(),
+        name="widget-bootstrap",
+    ),
+    path(
+        "booking/<uuid:uuid>",
+        public_views.booking_config(views.AppointmentViewSet.as_view()),
+    ),
     path("script/<uuid:uuid>.js", views.ServeScriptView.as_view()),
-    path("pr/<uuid:uuid>", views.PricingWidgetViewSet.as_view()),
+    re_path(
+        r"^script/(?P<uuid>[0-9a-f-]{36})\.(?P<script_hash>[0-9a-f]{16})\.js$",
+        views.HashedScriptView.as_view(),
+        name="widget-script",
+    ),
+    path(
+        "pr/<uuid:uuid>",
+        public_views.pricing_config(views.PricingWidgetViewSet.as_view()),
+    ),
+    path(
+        "v2/pricing/<str:pk>/",
+        public_views.pricing_v2_config(
+            views.PricingWidgetViewSetV2.as_view(
+                {
+                    "get": "retrieve",
+                    "put": "update",
+                    "patch": "partial_update",
+                    "delete": "destroy",
+                }
+            )
+        ),
+    ),
     path(
         "<uuid:uuid>/download-data",
         views.DownloadSubmittedDataView.as_view(),
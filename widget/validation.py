@@ -0,0 +1,249 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+
+PLAN_CACHE_SIZE = getattr(settings, "WIDGET_VALIDATION_PLAN_CACHE_SIZE", 1024)
+
+# Upper bounds for file fields; a field's own maxSize/maxFiles/accept can only
+# narrow them.
+UPLOAD_MAX_SIZE = getattr(settings, "WIDGET_UPLOAD_MAX_SIZE", 10 * 1024 * 1024)
+UPLOAD_MAX_FILES = getattr(settings, "WIDGET_UPLOAD_MAX_FILES", 5)
+UPLOAD_ALLOWED_TYPES = getattr(settings, "WIDGET_UPLOAD_ALLOWED_TYPES", None)
+
+# A structural check only; Django's validate_email costs more than the rest
+# of a typical submission put together.
+EMAIL_RE = re.compile(r"[^@\s]{1,64}@[^@\s.]+(\.[^@\s.]+)+")
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def _accepts(patterns, file_name, content_type):
+    content_type = (content_type or "").lower()
+    extension = os.path.splitext(file_name or "")[1].lower()
+    for pattern in patterns:
+        pattern = pattern.lower()
+        if pattern.startswith("."):
+            if extension == pattern:
+                return True
+        elif pattern.endswith("/*"):
+            if content_type.startswith(pattern[:-1]):
+                return True
+        elif content_type == pattern:
+            return True
+    return False
+
+
+class FileLimits:
+    __slots__ = ("label", "max_size", "max_files", "accept")
+
+    def __init__(self, field):
+        self.label = field.get("label")
+        self.max_size = min(field.get("maxSize") or UPLOAD_MAX_SIZE, UPLOAD_MAX_SIZE)
+        self.max_files = min(
+            field.get("maxFiles") or UPLOAD_MAX_FILES, UPLOAD_MAX_FILES
+        )
+        self.accept = field.get("accept")
+
+    def accepts(self, file_name, content_type):
+        if UPLOAD_ALLOWED_TYPES is not None and not _accepts(
+            UPLOAD_ALLOWED_TYPES, file_name, content_type
+        ):
+            return False
+        return not self.accept or _accepts(self.accept, file_name, content_type)
+
+
+class ValidationPlan:
+    __slots__ = ("values", "emails", "bounded", "consents", "files", "file_limits")
+
+    def __init__(self, fields):
+        # One tuple per kind of check, so each loop only does its own work.
+        # ``values`` holds every field that yields a value, in form order.
+        values, emails, bounded, consents, uploads = [], [], [], [], []
+        self.file_limits = {}
+        for field in fields:
+            field_id, field_type = field["id"], field["type"]
+            label = field.get("label")
+            required = field.get("required", False)
+            error = f"{label} is required."
+            if field_type == "file":
+                uploads.append((field_id, label, required, error))
+                self.file_limits[field_id] = FileLimits(field)
+            elif field_type == "consent":
+                if required:
+                    consents.append((field_id, label, error))
+            else:
+                values.append((field_id, label, field_type, required, error))
+                low, high = field.get("minLength"), field.get("maxLength")
+                if field_type == "email":
+                    emails.append((field_id, label))
+                elif low is not None or high is not None:
+                    bounded.append((field_id, label, low, high))
+        self.values = tuple(values)
+        self.emails = tuple(emails)
+        self.bounded = tuple(bounded)
+        self.consents = tuple(consents)
+        self.files = tuple(uploads)
+
+    def validate(self, data, files):
+        # field_values are only used when there are no errors, so the checks
+        # after the first loop need not take failed fields back out of them.
+        field_values = []
+        append = field_values.append
+        errors = {}
+        get = data.get
+        for field_id, label, field_type, required, error in self.values:
+            try:
+                value = get(field_id, "").strip()
+            except AttributeError:
+                value = _text(get(field_id))
+            if not value and required:
+                errors[label] = error
+                continue
+            append({"id": field_id, "label": label, "type": field_type, "value": value})
+        if self.emails:
+            match = EMAIL_RE.fullmatch
+            for field_id, label in self.emails:
+                try:
+                    value = get(field_id, "").strip()
+                except AttributeError:
+                    value = _text(get(field_id))
+                if value and (len(value) > 254 or match(value) is None):
+                    errors[label] = f"{label} must be a valid email address."
+        for field_id, label, low, high in self.bounded:
+            value = _text(get(field_id, ""))
+            if not value:
+                continue
+            if high is not None and len(value) > high:
+                errors[label] = f"{label} must be at most {high} characters."
+            elif low is not None and len(value) < low:
+                errors[label] = f"{label} must be at least {low} characters."
+        for field_id, label, error in self.consents:
+            value = get(field_id, "")
+            if value != "true" and _text(value) != "true":
+                errors[label] = error
+        uploads = []
+        for field_id, label, required, error in self.files:
+            # MultiValueDict.getlist raises and catches KeyError for a field
+            # with no files, which costs more than the rest of a field's checks.
+            uploaded_files = field_id in files and files.getlist(field_id)
+            if uploaded_files:
+                uploads.extend((field_id, upload) for upload in uploaded_files)
+            elif required:
+                errors[label] = error
+        return field_values, uploads, errors
+
+
+def _check_field(index, field, seen):
+    if not isinstance(field, dict):
+        raise ValidationError(f"Field {index} must be an object.")
+    for key in ("id", "type"):
+        if not isinstance(field.get(key), str) or not field[key]:
+            raise ValidationError(f'Field {index} needs a non-empty "{key}".')
+    if field["id"] in seen:
+        raise ValidationError(f'Field id "{field["id"]}" is used more than once.')
+    if "label" in field and not isinstance(field["label"], (str, type(None))):
+        raise ValidationError(f'Field "{field["id"]}" has a non-text "label".')
+    if not isinstance(field.get("required", False), bool):
+        raise ValidationError(f'Field "{field["id"]}" has a non-boolean "required".')
+    for key in ("minLength", "maxLength", "maxSize", "maxFiles"):
+        value = field.get(key)
+        if value is not None and (
+            isinstance(value, bool) or not isinstance(value, int) or value < 0
+        ):
+            raise ValidationError(
+                f'Field "{field["id"]}" has an invalid "{key}"; use a whole number.'
+            )
+    accept = field.get("accept")
+    if accept is not None and (
+        not isinstance(accept, list)
+        or not all(isinstance(pattern, str) and pattern for pattern in accept)
+    ):
+        raise ValidationError(
+            f'Field "{field["id"]}" has an invalid "accept"; use a list of MIME '
+            "types or extensions."
+        )
+
+
+def compile_plan(widget_fields):
+    if not isinstance(widget_fields, list):
+        raise ValidationError("widget_fields must be a list.")
+    seen = set()
+    for index, field in enumerate(widget_fields):
+        _check_field(index, field, seen)
+        seen.add(field["id"])
+    return ValidationPlan(widget_fields)
+
+
+def _salvage(field, seen):
+    # What submissions used of a field saved before widget_fields was
+    # checked, or None if it has no usable id and type.
+    if not isinstance(field, dict):
+        return None
+    field_id, field_type = field.get("id"), field.get("type")
+    if not (
+        isinstance(field_id, str)
+        and field_id
+        and isinstance(field_type, str)
+        and field_type
+    ) or field_id in seen:
+        return None
+    label = field.get("label")
+    return {
+        "id": field_id,
+        "type": field_type,
+        "label": label if label is None or isinstance(label, str) else str(label),
+        "required": bool(field.get("required")),
+    }
+
+
+def stored_fields(widget_fields):
+    # widget_fields as saved. Widgets saved before compile_plan checked them
+    # get their broken fields salvaged or dropped rather than failing every
+    # submission.
+    if not isinstance(widget_fields, list):
+        return []
+    fields = []
+    seen = set()
+    for index, field in enumerate(widget_fields):
+        try:
+            _check_field(index, field, seen)
+        except ValidationError:
+            field = _salvage(field, seen)
+            if field is None:
+                continue
+        seen.add(field["id"])
+        fields.append(field)
+    return fields
+
+
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+def get_plan(widget):
+    key = (widget.pk, widget.version)
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+
+    plan = compile_plan(stored_fields(widget.widget_fields))
+    with _plans_lock:
+        _plans[key] = plan
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
@@ -1,20 +1,65 @@
 from datetime import datetime
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q, TextField
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.utils import timezone
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.text import compress_sequence
+from django.urls import reverse
 from django.core.mail import send_mail
 from django.conf import settings
-from rest_framework import viewsets
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError as DRFValidationError
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework import status
 
-from widget.tasks import handle_google_sheet_integration, send_email_notifications
+from widget import ingest, recaptcha, rollups, sheets
+from widget.exports import (
+    EXPORT_CURSOR_HEADER,
+    EXPORT_FORMATS,
+    EXPORT_RENDERERS,
+    ExportContentNegotiation,
+    delta_bounds,
+    expire_stale_jobs,
+    export_content,
+    fingerprint,
+    ranged_file_response,
+)
+from widget.idempotency import get_idempotency_key, idempotent
+from widget.pagination import SubmissionCursorPagination, SubmissionSearchPagination
+from widget.schemas import encode, get_registry, get_schema
+from widget.scripts import open_script, publish_script
+from widget.search import search
+from widget.snapshots import (
+    PUBLIC_CACHE_MAX_AGE,
+    load_bootstrap,
+    load_snapshot,
+    load_snapshots,
+    publish_snapshot,
+    snapshot_response,
+)
+from widget.tasks import run_export_job, send_email_notifications
+from widget.throttling import SubmissionThrottle
+from widget.uploads import HashingUploadHandler, store_upload
+from widget.validation import get_plan
 from .permissions import IsAdminOrReadOnly
 from .serializers import (
     AppointmentDataSerializer,
     AppointmentWidgetSerializer,
+    ExportJobSerializer,
     FormTemplateSerializer,
     ImageUploadSerializer,
     PricingWidgetV2Serializer,
@@ -24,45 +69,60 @@ from .serializers import (
 )
 from .models import (
     AppointmentWidget,
+    ExportJob,
     FormTemplate,
     ImageUpload,
     PricingWidgetV2,
     SubmittedData,
     WidgetData,
-    WidgetFile,
+    WidgetRollup,
     Container,
 )
-import csv
-import requests
+import hashlib
+import re
+import uuid as uuid_lib
+
+
+ACCEPTS_GZIP = re.compile(r"\bgzip\b")
 
 
 class WidgetCodeView(APIView):
+    throttle_classes = [SubmissionThrottle]
+    submission_model = WidgetData
+
     def get(self, request, uuid):
-        try:
-            widget = WidgetData.objects.get(id=uuid)
-            serializer = WidgetSerializer(
-                widget,
-                context={"include_email_notification": False, "request": request},
-            )
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except WidgetData.DoesNotExist:
+        snapshot = load_snapshot(WidgetData, uuid, request)
+        if snapshot is None:
             return Response(
                 {"error": "Widget not found."}, status=status.HTTP_404_NOT_FOUND
             )
+        return snapshot_response(request, snapshot)
 
+    @idempotent("form")
     def post(self, request, uuid):
         try:
             widget = WidgetData.objects.get(id=uuid)
+            upload_handler = HashingUploadHandler(get_plan(widget), request)
+            request.upload_handlers = [upload_handler]
             if widget.spam_protection:
                 recaptcha_token = request.data.get("recaptchaToken")
                 if not recaptcha_token:
                     return self._error_response("Missing reCAPTCHA token")
-                if not self._validate_recaptcha(recaptcha_token):
+                idempotency_key = get_idempotency_key(request)
+                if not self._validate_recaptcha(
+                    recaptcha_token,
+                    f"{widget.id}:{idempotency_key}" if idempotency_key else None,
+                ):
                     return self._error_response("Invalid reCAPTCHA token")
 
-            field_values, errors = self._process_fields(request, widget)
+            field_values, errors = self._process_fields(
+                request, widget, upload_handler.errors
+            )
             if errors:
                 return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+            if ingest.is_buffered():
+                ingest.enqueue(widget, field_values)
+                return self._handle_post_submit_action(widget, field_values)
             email_receiver = next(
                 (i for i in field_values if i.get("type") == "email"), None
             )
@@ -70,11 +130,11 @@ class WidgetCodeView(APIView):
                 [f"{item['label']}: {item['value']}" for item in field_values]
             )
             if widget.user.is_oauth:
-                handle_google_sheet_integration.delay(
-                    widget_id=widget.id,
-                    model_name="widget.WidgetData",
-                    values=[item["value"] for item in field_values],
-                    sheet_header=[item["label"].lower() for item in field_values],
+                sheets.enqueue(
+                    "widget.WidgetData",
+                    widget.id,
+                    [item["label"].lower() for item in field_values],
+                    [[item["value"] for item in field_values]],
                 )
             user_data = "\n".join(
                 [f"{item['label']}: {item['value']}" for item in field_values]
@@ -94,7 +154,7 @@ class WidgetCodeView(APIView):
                     recipients_list=widget.email_notification.email,
                 )
 
-            self._save_submitted_data(uuid, field_values)
+            self._save_submitted_data(widget, field_values)
 
             return self._handle_post_submit_action(widget, field_values)
 
@@ -106,47 +166,17 @@ class WidgetCodeView(APIView):
     def _error_response(self, message):
         return Response({"error": message}, status=status.HTTP_400_BAD_REQUEST)
 
-    def _validate_recaptcha(self, recaptcha_token):
-        url = "https://www.google.com/recaptcha/api/siteverify"
-        response = requests.post(
-            url,
-            data={"secret": settings.RECAPTCHA_SECRET_KEY, "response": recaptcha_token},
-        )
-        result = response.json()
-        return result.get("success", False)
-
-    def _process_fields(self, request, widget):
-        field_values = []
-        errors = {}
-
-        for field in widget.widget_fields:
-            field_id = field["id"]
-            field_type = field["type"]
-            is_required = field["required"]
-            field_label = field.get("label")
-            value = None
-
-            if field_type == "file":
-                uploaded_files = request.FILES.getlist(field_id)
-                if is_required and not uploaded_files:
-                    errors[field_label] = f"{field_label} is required."
-                elif uploaded_files:
-                    widget_file = WidgetFile.objects.create(
-                        widget=widget, file=uploaded_files[0]
-                    )
-                    value = request.build_absolute_uri(widget_file.file.url)
-
-            else:
-                value = request.data.get(field_id, "").strip()
-                if field_type == "consent" and is_required and value != "true":
-                    errors[field_label] = f"{field_label} is required."
-                elif is_required and not value:
-                    errors[field_label] = f"{field_label} is required."
-                elif field_type != "consent":
-                    field_values.append(
-                        {"label": field_label, "type": field_type, "value": value}
-                    )
+    def _validate_recaptcha(self, recaptcha_token, scope=None):
+        return recaptcha.verify(recaptcha_token, scope=scope)
 
+    def _process_fields(self, request, widget, upload_errors=None):
+        field_values, uploads, errors = get_plan(widget).validate(
+            request.data, request.FILES
+        )
+        errors.update(upload_errors or {})
+        if not errors:
+            for field_id, uploaded_file in uploads:
+                store_upload(widget, field_id, uploaded_file)
         return field_values, errors
 
     def _send_email_notifications(self, widget, field_values):
@@ -175,9 +205,11 @@ class WidgetCodeView(APIView):
                 fail_silently=False,
             )
 
-    def _save_submitted_data(self, uuid, field_values):
-        data = {item["label"]: item["value"] for item in field_values}
-        SubmittedData.objects.create(widget_id=uuid, data=data)
+    def _save_submitted_data(self, widget, field_values):
+        schema = get_schema(widget)
+        SubmittedData.objects.create(
+            widget=widget, schema=schema, data=encode(schema, field_values)
+        )
 
     def _handle_post_submit_action(self, widget, field_values):
         if widget.post_submit_action == WidgetData.SUCCESS_MESSAGE:
@@ -194,78 +226,452 @@ class WidgetCodeView(APIView):
             return Response({"action": "hide_form"}, status=status.HTTP_200_OK)
 
 
+class WidgetBootstrapView(APIView):
+    def get(self, request, uuid):
+        snapshot = load_bootstrap(uuid, request)
+        if snapshot is None:
+            return Response(
+                {"error": "Widget not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+        version = str(snapshot["version"])
+        if request.query_params.get("v") != version:
+            # Unversioned and stale URLs point at the current version, whose
+            # content never changes and can be cached for good.
+            url = reverse("widget-bootstrap", args=[uuid])
+            response = redirect(f"{url}?v={version}")
+            patch_cache_control(response, public=True, max_age=PUBLIC_CACHE_MAX_AGE)
+            return response
+        return snapshot_response(
+            request, snapshot, content_type="application/javascript", max_age=31536000
+        )
+
+
+class WidgetBatchView(APIView):
+    WIDGET_TYPES = {
+        "form": WidgetData,
+        "pricing": Container,
+        "pricing_v2": PricingWidgetV2,
+        "booking": AppointmentWidget,
+    }
+    MAX_WIDGETS = getattr(settings, "WIDGET_BATCH_MAX_SIZE", 20)
+
+    def get(self, request):
+        ids = [i for i in request.query_params.get("ids", "").split(",") if i]
+        if not ids or len(ids) > self.MAX_WIDGETS:
+            return self._error_response(
+                f"Provide between 1 and {self.MAX_WIDGETS} widget ids."
+            )
+
+        requested = {}
+        for typed_id in ids:
+            widget_type, _, widget_id = typed_id.partition(":")
+            if widget_type not in self.WIDGET_TYPES:
+                return self._error_response(f"Unknown widget type: {widget_type}")
+            try:
+                widget_id = uuid_lib.UUID(widget_id)
+            except ValueError:
+                return self._error_response(f"Invalid widget id: {widget_id}")
+            pks = requested.setdefault(widget_type, [])
+            if widget_id not in pks:
+                pks.append(widget_id)
+
+        found = {
+            widget_type: load_snapshots(self.WIDGET_TYPES[widget_type], pks, request)
+            for widget_type, pks in requested.items()
+        }
+
+        parts = []
+        etags = []
+        for widget_type, pks in requested.items():
+            for pk in pks:
+                snapshot = found[widget_type].get(pk)
+                body = snapshot["body"] if snapshot else b"null"
+                etags.append(snapshot["etag"] if snapshot else "null")
+                key = f'"{widget_type}:{pk}":'.encode()
+                parts.append(key + body)
+
+        return snapshot_response(
+            request,
+            {
+                "etag": '"%s"'
+                % hashlib.sha256(",".join(etags).encode()).hexdigest()[:32],
+                "body": b"{" + b",".join(parts) + b"}",
+            },
+        )
+
+    def _error_response(self, message):
+        return Response({"error": message}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class ImageUploadViewSet(ModelViewSet):
     http_method_names = ["post"]
     serializer_class = ImageUploadSerializer
     queryset = ImageUpload.objects.all()
 
 
-class WidgetViewSet(ModelViewSet):
+def parse_count(param, value):
+    try:
+        value = int(value)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise DRFValidationError({param: "Use a non-negative integer."})
+    return value
+
+
+def parse_moment(param, value):
+    try:
+        moment = parse_datetime(value)
+        day = parse_date(value) if moment is None else None
+    except ValueError:
+        # Well formed but not a real date, e.g. 2024-13-01.
+        moment = day = None
+    if moment is None:
+        if day is None:
+            raise DRFValidationError({param: "Use an ISO 8601 date or date-time."})
+        moment = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class WidgetStatsMixin:
+    # Chart data read from WidgetRollup: a few hundred rows at most, however
+    # much the widget has received.
+    @action(detail=True)
+    def stats(self, request, pk=None):
+        try:
+            if not self.get_queryset().filter(pk=pk).exists():
+                raise Http404
+        except ValidationError:
+            raise Http404
+
+        params = request.query_params
+        period = params.get("period", WidgetRollup.DAY)
+        if period not in rollups.STEPS:
+            raise DRFValidationError({"period": "Use hour or day."})
+        until = (
+            parse_moment("until", params["until"])
+            if params.get("until")
+            else timezone.now()
+        )
+        since = (
+            parse_moment("since", params["since"])
+            if params.get("since")
+            else WidgetRollup.bucket(until, period)
+            - rollups.STEPS[period] * (rollups.DEFAULT_BUCKETS[period] - 1)
+        )
+        if since >= until:
+            raise DRFValidationError({"since": "Must be before until."})
+        if (until - since) / rollups.STEPS[period] > rollups.MAX_BUCKETS:
+            raise DRFValidationError(
+                {"since": f"At most {rollups.MAX_BUCKETS} {period}s per request."}
+            )
+
+        series = rollups.series(pk, period, since, until)
+        return Response(
+            {
+                "period": period,
+                "since": since,
+                "until": until,
+                "totals": {
+                    metric: sum(series[metric]) for metric in WidgetRollup.METRICS
+                },
+                "series": series,
+                "sheet_sync": sheets.lag(pk),
+            }
+        )
+
+
+class AtomicSaveMixin:
+    # Nested serializers save dozens of related rows; in one transaction the
+    # snapshot invalidations they trigger are applied once, on commit.
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+
+class WidgetViewSet(WidgetStatsMixin, AtomicSaveMixin, ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = WidgetSerializer
 
     def get_queryset(self):
+        queryset = WidgetData.objects.with_graph().filter(user=self.request.user)
         widget_type = self.request.query_params.get("widget_type")
         if widget_type:
-            return WidgetData.objects.filter(
-                user=self.request.user, widget_type__iexact=widget_type
-            )
-        return WidgetData.objects.filter(user=self.request.user)
+            return queryset.filter(widget_type__iexact=widget_type)
+        return queryset
 
     def get_serializer_context(self):
         return {"user_id": self.request.user.id, "request": self.request}
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        widget = serializer.instance
+        widget.refresh_from_db(fields=["version"])
+        publish_snapshot(widget, self.request)
+        get_plan(widget)
+        get_schema(widget)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        widget = serializer.instance
+        widget.refresh_from_db(fields=["version"])
+        widget._prefetched_objects_cache = {}
+        publish_snapshot(widget, self.request)
+        get_plan(widget)
+        get_schema(widget)
+
 
 class DownloadSubmittedDataView(APIView):
+    # The whole export, or with ?since=<cursor> only the submissions added
+    # after a previous export, in any of EXPORT_FORMATS (?format= or Accept).
     permission_classes = [IsAuthenticated]
+    renderer_classes = EXPORT_RENDERERS
+    content_negotiation_class = ExportContentNegotiation
 
     def get(self, request, uuid):
-        submitted_data = SubmittedData.objects.filter(
-            widget_id=uuid, widget__user=request.user
+        widget = (
+            WidgetData.objects.filter(pk=uuid, user=request.user)
+            .only("id", "version", "total_submissions")
+            .first()
         )
-
-        if not submitted_data.exists():
+        since = request.query_params.get("since")
+        if widget is None or (since is None and not widget.total_submissions):
             return Response({"error": "No data found."}, status=404)
 
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = (
-            f'attachment; filename="widget_{uuid}_data.csv"'
+        renderer = request.accepted_renderer
+        queryset = SubmittedData.objects.filter(widget=widget)
+        cursor = None
+        if since is None:
+            queryset = queryset.order_by("created_at", "id")
+        else:
+            since = parse_count("since", since)
+            limit = request.query_params.get("limit")
+            if limit is not None:
+                limit = parse_count("limit", limit) or None
+            cursor = delta_bounds(queryset, since, limit)
+            queryset = queryset.filter(id__gt=since, id__lte=cursor).order_by("id")
+
+        content = export_content(widget, renderer, queryset, meta=cursor is not None)
+        gzipped = renderer.compressible and ACCEPTS_GZIP.search(
+            request.META.get("HTTP_ACCEPT_ENCODING", "")
         )
+        if gzipped:
+            content = compress_sequence(content)
 
-        writer = csv.writer(response)
+        response = StreamingHttpResponse(content, content_type=renderer.media_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="widget_{uuid}_data.{renderer.format}"'
+        )
+        if cursor is not None:
+            response[EXPORT_CURSOR_HEADER] = str(cursor)
+        if gzipped:
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ["Accept", "Accept-Encoding"])
+        return response
 
-        keys = set()
-        for entry in submitted_data:
-            keys.update(entry.data.keys())
 
-        keys = sorted(keys)
-        writer.writerow(keys)
+class WidgetChildMixin:
+    # For viewsets nested under /form/<widget_pk>/.
+    def get_widget(self):
+        try:
+            return get_object_or_404(
+                WidgetData.objects.only("id", "version", "total_submissions"),
+                pk=self.kwargs["widget_pk"],
+                user=self.request.user,
+            )
+        except ValidationError:
+            raise Http404
 
-        for entry in submitted_data:
-            writer.writerow([entry.data.get(key, "") for key in keys])
 
-        return response
+class SubmittedDataView(WidgetChildMixin, viewsets.GenericViewSet):
+    permission_classes = [IsAuthenticated]
+    pagination_class = SubmissionCursorPagination
+    columns = ["id", "created_at", "data"]
+    data_lookups = ["iexact", "icontains", "startswith"]
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            if self.request.query_params.get("search"):
+                self._paginator = SubmissionSearchPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
+    def get_queryset(self):
+        return SubmittedData.objects.filter(widget_id=self.kwargs["widget_pk"])
+
+    def filter_submissions(self, queryset, widget):
+        params = self.request.query_params
+        if params.get("search"):
+            queryset = search(queryset, widget.pk, params["search"])
+        for param, lookup in (("created_after", "gte"), ("created_before", "lt")):
+            if params.get(param):
+                queryset = queryset.filter(
+                    **{f"created_at__{lookup}": parse_moment(param, params[param])}
+                )
 
-# class SubmittedDataView(viewsets.ModelViewSet):
-#     http_method_names = ["get"]
-#     serializer_class = SubmittedDataSerializer
-#     permission_classes = [IsAuthenticated]
+        registry = None
+        for index, (param, value) in enumerate(params.items()):
+            if not param.startswith("data."):
+                continue
+            registry = registry or get_registry(widget)
+            key, lookup = param[len("data."):], "exact"
+            head, _, tail = key.rpartition("__")
+            if head and tail in self.data_lookups:
+                key, lookup = head, tail
+            queryset = self._filter_data(queryset, registry, key, lookup, value, index)
+        return queryset
+
+    def _filter_data(self, queryset, registry, label, lookup, value, index):
+        # Legacy rows are keyed by label; the rest hold the field at a
+        # position that depends on their schema version.
+        aliases = {f"data_{index}": Cast(KeyTextTransform(label, "data"), TextField())}
+        condition = Q(schema__isnull=True, **{f"data_{index}__{lookup}": value})
+        schema_ids = {}
+        for schema_id, position in registry.positions(label):
+            schema_ids.setdefault(position, []).append(schema_id)
+        for position, ids in schema_ids.items():
+            alias = f"data_{index}_{position}"
+            aliases[alias] = Cast(KeyTextTransform(position, "data"), TextField())
+            condition |= Q(schema_id__in=ids, **{f"{alias}__{lookup}": value})
+        return queryset.alias(**aliases).filter(condition)
+
+    def get_fields(self):
+        requested = self.request.query_params.get("fields")
+        if not requested:
+            return self.columns, []
+        names = [name.strip() for name in requested.split(",") if name.strip()]
+        unknown = [
+            name
+            for name in names
+            if name not in self.columns and not name.startswith("data.")
+        ]
+        if unknown:
+            raise DRFValidationError({"fields": f"Unknown fields: {', '.join(unknown)}"})
+        return (
+            [name for name in self.columns if name in names],
+            [name[len("data."):] for name in names if name.startswith("data.")],
+        )
 
-#     def get_queryset(self):
-#         widget_id = self.kwargs["widget_pk"]
-#         return SubmittedData.objects.filter(widget__id=widget_id)
+    def select(self, queryset):
+        fields, data_keys = self.get_fields()
+        columns = ["id", "created_at"]
+        if "data" in fields or data_keys:
+            columns += ["schema_id", "data"]
+        if "rank" in queryset.query.annotations:
+            columns.append("rank")
+        return queryset.values(*columns), fields, data_keys
+
+    def render(self, rows, widget, fields, data_keys):
+        schema_ids = {row.get("schema_id") for row in rows} - {None}
+        registry = get_registry(widget, schema_ids) if schema_ids else None
+        items = []
+        for row in rows:
+            item = {name: row[name] for name in fields if name != "data"}
+            if "rank" in row:
+                item["rank"] = row["rank"]
+            if "data" in fields or data_keys:
+                data = row["data"]
+                if row["schema_id"] is not None:
+                    data = registry.decode(row["schema_id"], data)
+                if data_keys:
+                    data = {key: data.get(key) for key in data_keys}
+                item["data"] = data
+            items.append(item)
+        return items
+
+    def list(self, request, widget_pk=None):
+        widget = self.get_widget()
+        queryset, fields, data_keys = self.select(
+            self.filter_submissions(self.get_queryset(), widget)
+        )
+        page = self.paginate_queryset(queryset)
+        return self.paginator.get_paginated_response(
+            self.render(page, widget, fields, data_keys),
+            total_submissions=widget.total_submissions,
+        )
 
-#     def list(self, request, *args, **kwargs):
-#         queryset = self.get_queryset()
+    def retrieve(self, request, pk=None, widget_pk=None):
+        widget = self.get_widget()
+        queryset, fields, data_keys = self.select(self.get_queryset())
+        row = queryset.filter(pk=pk).first() if pk.isdigit() else None
+        if row is None:
+            raise Http404
+        return Response(self.render([row], widget, fields, data_keys)[0])
+
+
+class ExportJobViewSet(
+    WidgetChildMixin,
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    # Exports run on a worker; clients poll the job and then download the
+    # file, resuming with Range requests if interrupted.
+    permission_classes = [IsAuthenticated]
+    serializer_class = ExportJobSerializer
 
-#         total_submissions = queryset.count()
+    def get_queryset(self):
+        return ExportJob.objects.filter(
+            widget_id=self.kwargs["widget_pk"], widget__user=self.request.user
+        ).order_by("-created_at")
 
-#         serializer = self.get_serializer(queryset, many=True)
+    def get_object(self):
+        try:
+            return super().get_object()
+        except ValidationError:
+            raise Http404
+
+    def create(self, request, widget_pk=None):
+        widget = self.get_widget()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        export_format = serializer.validated_data.get("format", ExportJob.CSV)
+        data_fingerprint = fingerprint(widget)
+
+        expire_stale_jobs(widget)
+        job = (
+            ExportJob.objects.filter(
+                widget=widget, format=export_format, fingerprint=data_fingerprint
+            )
+            .exclude(status=ExportJob.FAILED)
+            .first()
+        )
+        if job is not None:
+            # Nothing changed since this export; hand it out again.
+            return Response(self.get_serializer(job).data)
+
+        job = serializer.save(
+            widget=widget,
+            fingerprint=data_fingerprint,
+            rows_total=widget.total_submissions,
+        )
+        transaction.on_commit(lambda: run_export_job.delay(str(job.pk)))
+        return Response(self.get_serializer(job).data, status=status.HTTP_201_CREATED)
 
-#         return Response(
-#             {"total_submissions": total_submissions, "submissions": serializer.data}
-#         )
+    @action(detail=True)
+    def download(self, request, pk=None, widget_pk=None):
+        job = self.get_object()
+        if job.status != ExportJob.DONE:
+            return Response(
+                {"error": "Export is not ready."}, status=status.HTTP_409_CONFLICT
+            )
+        return ranged_file_response(
+            request,
+            job.file,
+            job.size,
+            etag=f'"{job.pk}"',
+            filename=f"widget_{job.widget_id}_data.{job.format}",
+            content_type=EXPORT_FORMATS[job.format].media_type,
+        )
 
 
 class FormTemplateViewSet(viewsets.ModelViewSet):
@@ -276,14 +682,48 @@ class FormTemplateViewSet(viewsets.ModelViewSet):
 
 class ServeScriptView(APIView):
     def get(self, request, uuid):
-        widget = get_object_or_404(WidgetData, id=uuid)
-        return HttpResponse(widget.script, content_type="application/javascript")
+        script_hash = get_object_or_404(
+            WidgetData.objects.exclude(script_hash=None).values_list(
+                "script_hash", flat=True
+            ),
+            id=uuid,
+        )
+        response = redirect("widget-script", uuid=uuid, script_hash=script_hash)
+        patch_cache_control(response, public=True, max_age=PUBLIC_CACHE_MAX_AGE)
+        return response
+
+
+class HashedScriptView(APIView):
+    def get(self, request, uuid, script_hash):
+        accept_encoding = request.headers.get("Accept-Encoding", "")
+        script, encoding = open_script(uuid, script_hash, accept_encoding)
+        if script is None:
+            widget = get_object_or_404(WidgetData, id=uuid, script_hash=script_hash)
+            publish_script(widget)
+            script, encoding = open_script(uuid, script_hash, accept_encoding)
+
+        etag = f'"{script_hash}-{encoding}"' if encoding else f'"{script_hash}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = FileResponse(
+                script,
+                filename=f"{uuid}.{script_hash}.js",
+                content_type="application/javascript",
+            )
+            if encoding:
+                response["Content-Encoding"] = encoding
+        else:
+            script.close()
+        response["ETag"] = etag
+        response["Vary"] = "Accept-Encoding"
+        patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+        return response
 
 
 # Pricing Widget
 
 
-class ContainerViewSet(ModelViewSet):
+class ContainerViewSet(AtomicSaveMixin, ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -301,17 +741,18 @@ class ContainerViewSet(ModelViewSet):
 
 class PricingWidgetViewSet(APIView):
     def get(self, request, uuid):
-        queryset = Container.objects.get(id=uuid)
-        serializer = ContainerSerializer(
-            queryset, context={"request": self.request, "view_layout": False}
-        )
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        snapshot = load_snapshot(Container, uuid, request)
+        if snapshot is None:
+            return Response(
+                {"error": "Widget not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+        return snapshot_response(request, snapshot)
 
 
 # Appointment Widget
 
 
-class AppointmentWidgetViewSet(ModelViewSet):
+class AppointmentWidgetViewSet(WidgetStatsMixin, AtomicSaveMixin, ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = AppointmentWidgetSerializer
 
@@ -323,16 +764,18 @@ class AppointmentWidgetViewSet(ModelViewSet):
 
 
 class AppointmentViewSet(APIView):
+    throttle_classes = [SubmissionThrottle]
+    submission_model = AppointmentWidget
+
     def get(self, request, uuid):
-        try:
-            queryset = AppointmentWidget.objects.get(id=uuid)
-        except AppointmentWidget.DoesNotExist:
+        snapshot = load_snapshot(AppointmentWidget, uuid, request)
+        if snapshot is None:
             return Response(
                 {"error": "widget doesn't exist"}, status=status.HTTP_404_NOT_FOUND
             )
-        serializer = AppointmentWidgetSerializer(queryset, context={"request": request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return snapshot_response(request, snapshot)
 
+    @idempotent("booking")
     def post(self, request, uuid):
         try:
             queryset = AppointmentWidget.objects.get(id=uuid)
@@ -341,13 +784,14 @@ class AppointmentViewSet(APIView):
 
             response_data = {"message": "Appointment booked successfully!"}
             response = Response(response_data, status=status.HTTP_201_CREATED)
+            WidgetRollup.add(queryset.id, "bookings", [timezone.now()])
 
             if queryset.user.is_oauth:
-                handle_google_sheet_integration.delay(
-                    widget_id=queryset.id,
-                    model_name="widget.AppointmentWidget",
-                    values=list(serializers.data.values()),
-                    sheet_header=["Name", "Email", "Date Time", "Note"],
+                sheets.enqueue(
+                    "widget.AppointmentWidget",
+                    queryset.id,
+                    ["Name", "Email", "Date Time", "Note"],
+                    [list(serializers.data.values())],
                 )
 
             if queryset.owner_notification and queryset.owner_email:
@@ -376,7 +820,7 @@ class AppointmentViewSet(APIView):
 # Version 2 Pricing Widget
 
 
-class PricingWidgetViewSetV2(ModelViewSet):
+class PricingWidgetViewSetV2(AtomicSaveMixin, ModelViewSet):
     serializer_class = PricingWidgetV2Serializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
@@ -388,3 +832,15 @@ class PricingWidgetViewSetV2(ModelViewSet):
 
     def get_serializer_context(self):
         return {"request": self.request}
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            pk = uuid_lib.UUID(kwargs["pk"])
+        except ValueError:
+            raise Http404
+        snapshot = load_snapshot(PricingWidgetV2, pk, request)
+        if snapshot is None:
+            raise Http404
+        return snapshot_response(request, snapshot)